@@ -77,7 +77,8 @@ from .core import PSC2_FROM_PSC1, PSC1_FROM_PSC2
 from .core import DOB_FROM_PSC1, SEX_FROM_PSC1
 from .core import Error
 from .psytools import read_psytools
-from .dicom_utils import read_metadata
+from .dicom_utils import read_metadata, read_metadata_many
+from .dicom_utils import diffusion_convention
 from .image_data import walk_image_data, report_image_data
 
 from . import sanity
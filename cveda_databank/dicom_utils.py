@@ -34,14 +34,145 @@ logger = logging.getLogger(__name__)
 import re
 import datetime
 import dateutil.tz
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import pandas
 try:
-    import dicom
-except ImportError:
+    from functools import lru_cache
+except ImportError:  # Python 2
+    def lru_cache(maxsize=128):
+        def decorator(function):
+            return function
+        return decorator
+
+
+#
+# DICOM header parsing backends
+#
+# abstract base class, spelled for both Python 2 and 3
+_ABC = ABCMeta('_ABC', (object,), {'__slots__': ()})
+
+
+class _DicomBackend(_ABC):
+    """Interface to a package parsing DICOM files.
+
+    Attributes
+    ----------
+    name : str
+        Name of the underlying package.
+    InvalidDicomError : type
+        Exception raised by the package when a file is not valid DICOM.
+
+    """
+    name = None
+    InvalidDicomError = None
+
+    @abstractmethod
+    def read(self, fp, force=False, tags=None):
+        """Read the header of a DICOM file, stopping before pixel data.
+
+        Parameters
+        ----------
+        fp : str or file-like
+            DICOM file to read.
+        force : bool
+            If True read nonstandard files, typically without "Part 10" headers.
+        tags : sequence of str, optional
+            Keywords of DICOM tags to read. Other tags may be skipped.
+
+        Returns
+        -------
+        Dataset
+
+        """
+
+    @abstractmethod
+    def is_multi_value(self, value):
+        """Check whether the value of a data element is multi-valued.
+
+        """
+
+
+class _PydicomBackend(_DicomBackend):
+    """Modern pydicom package, version 1.0 and later.
+
+    Only whitelisted tags are parsed and large values of whitelisted tags
+    are not read until they are accessed.
+
+    """
+    name = 'pydicom'
+
+    # values larger than this are read only if accessed
+    _DEFER_SIZE = 1024
+
+    def __init__(self):
+        import pydicom
+        from pydicom.errors import InvalidDicomError
+        from pydicom.multival import MultiValue
+        self._pydicom = pydicom
+        self._multi_value = MultiValue
+        self.InvalidDicomError = InvalidDicomError
+
+    def read(self, fp, force=False, tags=None):
+        # deferred reads reopen files by name, impossible with file objects
+        if hasattr(fp, 'read'):
+            defer_size = None
+        else:
+            defer_size = self._DEFER_SIZE
+        return self._pydicom.dcmread(fp, defer_size=defer_size,
+                                     stop_before_pixels=True, force=force,
+                                     specific_tags=tags)
+
+    def is_multi_value(self, value):
+        return isinstance(value, self._multi_value)
+
+
+class _LegacyDicomBackend(_DicomBackend):
+    """Legacy dicom package, pydicom before version 1.0.
+
+    This package cannot parse specific tags only.
+
+    """
+    name = 'dicom'
+
+    def __init__(self):
+        import dicom
+        from dicom.filereader import InvalidDicomError
+        self._dicom = dicom
+        self.InvalidDicomError = InvalidDicomError
+
+    def read(self, fp, force=False, tags=None):
+        return self._dicom.read_file(fp, stop_before_pixels=True, force=force)
+
+    def is_multi_value(self, value):
+        return self._dicom.dataelem.isMultiValue(value)
+
+
+def _find_backend():
+    """Find the preferred DICOM package available.
+
+    Returns
+    -------
+    _DicomBackend
+        None if no DICOM package is available.
+
+    """
+    for backend in (_PydicomBackend, _LegacyDicomBackend):
+        try:
+            return backend()
+        except ImportError:
+            continue
+    logger.warning('cannot find pydicom or dicom package')
+    return None
+
+
+_BACKEND = _find_backend()
+if _BACKEND is None:
     HAS_DICOM = False
     InvalidDicomError = None
 else:
     HAS_DICOM = True
-    from dicom.filereader import InvalidDicomError  # noqa # pylint: disable=unused-import
+    InvalidDicomError = _BACKEND.InvalidDicomError
 
 
 #
@@ -50,7 +181,11 @@ else:
 _REGEX_DT = re.compile(r"((\d{4,14})(\.(\d{1,6}))?)([+-]\d{4})?")
 _REGEX_TM = re.compile(r"(\d{2,6})(\.(\d{1,6}))?")
 
+# within a series most files share the same date/time strings
+_CACHE_SIZE = 1024
+
 
+@lru_cache(maxsize=_CACHE_SIZE)
 def _datetime_from_dt(dt):
     """Convert DICOM DateTime to Python datetime.
 
@@ -64,6 +199,10 @@ def _datetime_from_dt(dt):
     datetime.datetime
 
     """
+    # fast path for the usual YYYYMMDDHHMMSS form
+    if len(dt) == 14 and dt.isdigit():
+        return datetime.datetime(int(dt[0:4]), int(dt[4:6]), int(dt[6:8]),
+                                 int(dt[8:10]), int(dt[10:12]), int(dt[12:14]))
     match = _REGEX_DT.match(dt)
     if match and len(dt) <= 26:
         dt_match = match.group(2)
@@ -110,6 +249,7 @@ def _datetime_from_dt(dt):
         return None
 
 
+@lru_cache(maxsize=_CACHE_SIZE)
 def _date_from_da(da):
     """Convert DICOM Date to Python date.
 
@@ -139,6 +279,7 @@ def _date_from_da(da):
         return None
 
 
+@lru_cache(maxsize=_CACHE_SIZE)
 def _time_from_tm(tm):
     """Convert DICOM Time to Python time.
 
@@ -152,6 +293,9 @@ def _time_from_tm(tm):
     datetime.time
 
     """
+    # fast path for the usual HHMMSS form
+    if len(tm) == 6 and tm.isdigit():
+        return datetime.time(int(tm[0:2]), int(tm[2:4]), int(tm[4:6]))
     match = _REGEX_TM.match(tm)
     if match and len(tm) <= 16:
         tm_match = match.group(1)
@@ -176,7 +320,84 @@ def _time_from_tm(tm):
         return None
 
 
-def read_metadata(path, force=False):
+#
+# find c-VEDA subject ID
+#
+# DICOM tags used by acquisition centres to store the c-VEDA subject ID,
+# in order of precedence when the acquisition centre is unknown
+_PATIENT_ID_TAGS = (
+    'CommentsOnThePerformedProcedureStep',  # (0040,0280)
+    'PatientComments',  # (0010,4000)
+    'StudyComments',  # (0032,4000)
+    'PatientID',  # (0010,0020)
+    'PatientName',  # (0010,0010)
+)
+
+# DICOM tags used by each acquisition centre, in order of precedence
+PATIENT_ID_TAGS_FROM_CENTER = {
+    'MYSORE': (
+        'CommentsOnThePerformedProcedureStep',
+    ),
+    'NIMHANS': (
+        'PatientComments',  # with RIS (starting from 2017-01-19)
+        'StudyComments',  # with RIS (single dataset on 2016-12-31)
+        'PatientID',  # before RIS (pilots from May 2016 to 2016-12-17)
+    ),
+    'NIMHANS_pilot': (
+        'PatientID',
+    ),
+    'PGIMER': (
+        'PatientID',
+    ),
+    'KOLKATA': (
+        'PatientName',
+    ),
+}
+
+# DICOM tags read by read_metadata(), in addition to the c-VEDA subject ID
+_METADATA_TAGS = (
+    'SOPInstanceUID',
+    'SeriesInstanceUID',
+    'SeriesNumber',
+    'SeriesDescription',
+    'ProtocolName',
+    'ImageType',
+    'AcquisitionDateTime',
+    'AcquisitionDate',
+    'AcquisitionTime',
+    'StationName',
+    'Manufacturer',
+    'ManufacturerModelName',
+    'DeviceSerialNumber',
+    'SoftwareVersions',
+)
+
+# header-only whitelist of DICOM tags for each acquisition centre
+_HEADER_TAGS_FROM_CENTER = {
+    center: _METADATA_TAGS + tags
+    for center, tags in PATIENT_ID_TAGS_FROM_CENTER.items()
+}
+_HEADER_TAGS = _METADATA_TAGS + _PATIENT_ID_TAGS
+
+
+def _header_tags(center=None):
+    """Whitelist of DICOM tags read by :py:func:`read_metadata`.
+
+    Parameters
+    ----------
+    center : str, optional
+        Acquisition centre.
+
+    Returns
+    -------
+    tuple
+        DICOM keywords.
+
+    """
+    return _HEADER_TAGS_FROM_CENTER.get(center, _HEADER_TAGS)
+
+
+def read_metadata(path, force=False, center=None):
     """Read select metadata from a DICOM file.
 
     We always attempt to read the following required DICOM tags. An exception
@@ -201,10 +422,16 @@ def read_metadata(path, force=False):
 
     Parameters
     ----------
-    path : str
-        Path name of the DICOM file.
+    path : str or file-like
+        Path name of the DICOM file, or file object to read the DICOM file
+        from, such as a member of a ZIP file. Only the header is read.
     force : bool
         If True read nonstandard files, typically without "Part 10" headers.
+    center : str, optional
+        Acquisition centre. If known, look for the c-VEDA subject ID only
+        in DICOM tags used by this centre, as listed in
+        :py:data:`PATIENT_ID_TAGS_FROM_CENTER`. Otherwise look for the
+        c-VEDA subject ID in all DICOM tags used by any centre.
 
     Returns
     -------
@@ -212,7 +439,7 @@ def read_metadata(path, force=False):
 
     """
     if HAS_DICOM:
-        dataset = dicom.read_file(path, force=force)
+        dataset = _BACKEND.read(path, force=force, tags=_header_tags(center))
     else:
         return {
             'SOPInstanceUID': None,
@@ -261,7 +488,7 @@ def read_metadata(path, force=False):
     if 'DeviceSerialNumber' in dataset:
         metadata['DeviceSerialNumber'] = dataset.DeviceSerialNumber
     if 'SoftwareVersions' in dataset:
-        if dicom.dataelem.isMultiValue(dataset.SoftwareVersions):
+        if _BACKEND.is_multi_value(dataset.SoftwareVersions):
             # usually the last part is the more informative
             # for example on Philips scanners:
             # ['3.2.1', '3.2.1.1'] → '3.2.1.1'
@@ -270,26 +497,136 @@ def read_metadata(path, force=False):
             metadata['SoftwareVersions'] = dataset.SoftwareVersions
 
     # find c-VEDA subject ID
-    if 'CommentsOnThePerformedProcedureStep' in dataset and dataset.CommentsOnThePerformedProcedureStep:
-        # MYSORE
-        # (0040,0280)
-        metadata['PatientID'] = dataset.CommentsOnThePerformedProcedureStep
-    elif 'PatientComments' in dataset and dataset.PatientComments:
-        # NIMHANS with RIS (starting from 2017-01-19)
-        # (0010,4000)
-        metadata['PatientID'] = dataset.PatientComments
-    elif 'StudyComments' in dataset and dataset.StudyComments:
-        # NIMHANS with RIS (single dataset on 2016-12-31)
-        # (0032,4000)
-        metadata['PatientID'] = dataset.StudyComments
-    elif 'PatientID' in dataset and dataset.PatientID:
-        # PGIMER
-        # NIMHANS before RIS (pilots from May 2016 to 2016-12-17)
-        # (0010,0020)
-        metadata['PatientID'] = dataset.PatientID
-    elif 'PatientName' in dataset and dataset.PatientName:
-        # KOLKATA
-        # (0010,0010)
-        metadata['PatientID'] = dataset.PatientName
+    for tag in PATIENT_ID_TAGS_FROM_CENTER.get(center, _PATIENT_ID_TAGS):
+        patient_id = getattr(dataset, tag, None)
+        if patient_id:
+            if tag == 'PatientName':
+                # PersonName object in modern pydicom
+                patient_id = str(patient_id)
+            metadata['PatientID'] = patient_id
+            break
 
     return metadata
+
+
+# tags holding the diffusion b-value, possibly followed by tags holding
+# the gradient direction, by order of preference
+_DIFFUSION_TAGS = (
+    ('standard', (0x00189087, 0x00189089)),
+    ('Siemens', (0x0019100C, 0x0019100E)),
+    ('Philips', (0x20011003, 0x200510B0, 0x200510B1, 0x200510B2)),
+    ('GE', (0x00431039,)),
+)
+
+
+def diffusion_convention(path, force=False):
+    """Find which tags of a DICOM file hold diffusion parameters.
+
+    Converters such as dcm2niix derive bvec/bval files from these tags:
+        - standard tags (0018,9087) and (0018,9089)
+        - Siemens private tags (0019,100C) and (0019,100E)
+        - Philips private tags (2001,1003) and (2005,10B0-10B2)
+        - GE private tag (0043,1039)
+
+    Parameters
+    ----------
+    path : str or file-like
+        Path name of the DICOM file, or file object to read the DICOM file
+        from. Only the header is read.
+    force : bool
+        If True read nonstandard files, typically without "Part 10" headers.
+
+    Returns
+    -------
+    str
+        One of 'standard', 'Siemens', 'Philips', 'GE', or None if the
+        b-value cannot be found or no DICOM package is available.
+
+    """
+    if not HAS_DICOM:
+        return None
+
+    tags = [tag for convention, tags in _DIFFUSION_TAGS for tag in tags]
+    dataset = _BACKEND.read(path, force=force, tags=tags)
+    for convention, tags in _DIFFUSION_TAGS:
+        if tags[0] in dataset:
+            return convention
+    return None
+
+
+# columns of the table returned by read_metadata_many()
+_METADATA_COLUMNS = (
+    'SOPInstanceUID',
+    'SeriesInstanceUID',
+    'SeriesNumber',
+    'SeriesDescription',
+    'ImageType',
+    'AcquisitionDate',
+    'AcquisitionTime',
+    'StationName',
+    'Manufacturer',
+    'ManufacturerModelName',
+    'DeviceSerialNumber',
+    'SoftwareVersions',
+    'PatientID',
+)
+
+
+def _read_metadata_row(path, force=False, center=None):
+    """Read select metadata from a DICOM file into a table row.
+
+    Errors are not raised but reported in the 'Error' column.
+
+    """
+    try:
+        metadata = read_metadata(path, force=force, center=center)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.debug('cannot read DICOM file (%s): %s', str(e), path)
+        row = dict.fromkeys(_METADATA_COLUMNS)
+        row['Error'] = '{0}: {1}'.format(type(e).__name__, e)
+    else:
+        row = {column: metadata.get(column) for column in _METADATA_COLUMNS}
+        if row['ImageType'] is not None:
+            # hashable, so that the column can be grouped
+            row['ImageType'] = tuple(row['ImageType'])
+        row['Error'] = None
+    return row
+
+
+def read_metadata_many(paths, force=False, center=None, workers=None):
+    """Read select metadata from many DICOM files into a table.
+
+    Each file is read with :py:func:`read_metadata`. Files that cannot be
+    read do not raise an exception, instead the error is reported in column
+    'Error' and the metadata columns are left empty.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        Path names of the DICOM files.
+    force : bool
+        If True read nonstandard files, typically without "Part 10" headers.
+    center : str, optional
+        Acquisition centre, see :py:func:`read_metadata`.
+    workers : int, optional
+        Number of threads reading files concurrently. By default files are
+        read sequentially.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per file, indexed by path name. One column per DICOM tag
+        read by :py:func:`read_metadata`, plus column 'Error'.
+
+    """
+    paths = list(paths)
+
+    if workers and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(lambda path: _read_metadata_row(path, force, center),
+                                     paths))
+    else:
+        rows = [_read_metadata_row(path, force, center) for path in paths]
+
+    return pandas.DataFrame(rows, index=pandas.Index(paths, name='Path'),
+                            columns=_METADATA_COLUMNS + ('Error',))
@@ -34,14 +34,139 @@ logger = logging.getLogger(__name__)
 import os
 import time
 import datetime
+import threading
 from collections import namedtuple
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir  # Python 2
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
 
 from .dicom_utils import read_metadata
 from .dicom_utils import InvalidDicomError
 
 
-def walk_image_data(path, force=False):
+def _scan_files(top, prefix_len):
+    """Iteratively list files in a directory tree.
+
+    Symbolic links to directories are not followed, as in os.walk().
+    Directories that cannot be read are skipped and an error is logged.
+
+    Parameters
+    ----------
+    top : str
+        Directory to list files from.
+    prefix_len : int
+        Length of the prefix to strip from paths to obtain relative paths.
+
+    Yields
+    ------
+    tuple
+        Yields a triplet (abspath, relpath, filename).
+
+    """
+    stack = [top]
+    while stack:
+        directory = stack.pop()
+        subdirectories = []
+        try:
+            entries = list(scandir(directory))
+        except OSError as e:
+            logger.error('cannot list directory (%s): %s', str(e), directory)
+            continue
+        for entry in entries:
+            # DirEntry caches the result of stat calls
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirectories.append(entry.path)
+            else:
+                yield (entry.path, entry.path[prefix_len:], entry.name)
+        stack.extend(reversed(subdirectories))
+
+
+# maximal number of files listed ahead of metadata reader
+_QUEUE_SIZE = 1024
+
+_SCAN_DONE = object()
+
+
+def _scan_files_concurrently(top, prefix_len, workers):
+    """List files in a directory tree, listing subdirectories concurrently.
+
+    Each subdirectory of `top` is listed in a separate thread. Files are
+    passed to the caller through a bounded queue.
+
+    Parameters
+    ----------
+    top : str
+        Directory to list files from.
+    prefix_len : int
+        Length of the prefix to strip from paths to obtain relative paths.
+    workers : int
+        Number of threads listing subdirectories.
+
+    Yields
+    ------
+    tuple
+        Yields a triplet (abspath, relpath, filename).
+
+    """
+    files_queue = queue.Queue(maxsize=_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item):
+        # give up if the caller stops consuming items
+        while not stop.is_set():
+            try:
+                files_queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def scan(directory):
+        try:
+            for item in _scan_files(directory, prefix_len):
+                if not put(item):
+                    break
+        finally:
+            put(_SCAN_DONE)
+
+    try:
+        entries = list(scandir(top))
+    except OSError as e:
+        logger.error('cannot list directory (%s): %s', str(e), top)
+        return
+    subdirectories = [entry.path for entry in entries
+                      if entry.is_dir() and not entry.is_symlink()]
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(scan, d) for d in subdirectories]
+        for entry in entries:
+            if not entry.is_dir():
+                yield (entry.path, entry.path[prefix_len:], entry.name)
+        remaining = len(futures)
+        while remaining:
+            item = files_queue.get()
+            if item is _SCAN_DONE:
+                remaining -= 1
+            else:
+                yield item
+        for future in futures:
+            future.result()  # propagate exceptions
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def walk_image_data(path, force=False, workers=None):
     """Generate information on DICOM files in a directory.
 
     File that cannot be read are skipped and an error message is logged.
@@ -52,6 +177,10 @@ def walk_image_data(path, force=False):
         Directory to read DICOM files from.
     force : bool
         Try reading nonstandard DICOM files, typically without "PART 10" headers.
+    workers : int, optional
+        Number of threads listing subdirectories of `path` concurrently,
+        useful on network file systems. By default the directory tree is
+        listed sequentially.
 
     Yields
     ------
@@ -65,31 +194,34 @@ def walk_image_data(path, force=False):
 
     logger.info('start processing files: %s', path)
 
-    for root, dummy_dirs, files in os.walk(path):
-        n += len(files)
-        for filename in files:
-            abspath = os.path.join(root, filename)
-            relpath = os.path.normpath(os.path.relpath(abspath, path))
-            # skip DICOMDIR since we are going to read all DICOM files anyway
-            if filename == 'DICOMDIR':
-                continue
-            logger.debug('read file: %s', relpath)
-            try:
-                metadata = read_metadata(abspath, force=force)
-            except IOError as e:
-                logger.error('cannot read file (%s): %s', str(e), relpath)
-            except InvalidDicomError as e:
-                logger.error('cannot read nonstandard DICOM file: %s: %s', str(e), relpath)
-            except AttributeError as e:
-                logger.error('missing attribute: %s: %s', str(e), relpath)
-            else:
-                yield (metadata, relpath)
+    prefix_len = len(os.path.join(path, ''))
+    if workers and workers > 1:
+        files = _scan_files_concurrently(path, prefix_len, workers)
+    else:
+        files = _scan_files(path, prefix_len)
+
+    for abspath, relpath, filename in files:
+        n += 1
+        # skip DICOMDIR since we are going to read all DICOM files anyway
+        if filename == 'DICOMDIR':
+            continue
+        logger.debug('read file: %s', relpath)
+        try:
+            metadata = read_metadata(abspath, force=force)
+        except IOError as e:
+            logger.error('cannot read file (%s): %s', str(e), relpath)
+        except InvalidDicomError as e:
+            logger.error('cannot read nonstandard DICOM file: %s: %s', str(e), relpath)
+        except AttributeError as e:
+            logger.error('missing attribute: %s: %s', str(e), relpath)
+        else:
+            yield (metadata, relpath)
 
     elapsed = time.time() - start
     logger.info('processed %d files in %.2f s: %s', n, elapsed, path)
 
 
-def report_image_data(path, force=False):
+def report_image_data(path, force=False, workers=None):
     """Find DICOM files loosely organized according to the c-VEDA SOPs.
 
     The c-VEDA FU2 SOPs define a precise file organization for Image Data. In
@@ -106,6 +238,8 @@ def report_image_data(path, force=False):
         Directory to read DICOM files from.
     force : bool
         Try reading nonstandard DICOM files, typically without "PART 10" headers.
+    workers : int, optional
+        Number of threads listing subdirectories, see :py:func:`walk_image_data`.
 
     Returns
     -------
@@ -117,7 +251,7 @@ def report_image_data(path, force=False):
 
     series_dict = {}
 
-    for (metadata, relpath) in walk_image_data(path, force=force):
+    for (metadata, relpath) in walk_image_data(path, force=force, workers=workers):
         # compulsory metadata
         series_uid = metadata['SeriesInstanceUID']
         image_uid = metadata['SOPInstanceUID']
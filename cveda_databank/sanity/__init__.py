@@ -31,4 +31,8 @@
 
 from .imaging import check_zip_name
 from .imaging import check_zip_content
-from .imaging import ZipTree
+from .imaging import Sampling
+from .imaging import ZipTree, CompactZipTree
+from .integrity import check_zip_integrity
+from .quarantine import check_quarantine
+from .cache import VerdictCache, zip_fingerprint, CACHE_VERSION
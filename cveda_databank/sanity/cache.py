@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import os
+import json
+import struct
+import hashlib
+import tempfile
+from collections import namedtuple
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = ['Fingerprint', 'zip_fingerprint', 'VerdictCache', 'CACHE_VERSION']
+
+# increment whenever sanity checks change, to invalidate cached results
+CACHE_VERSION = 1
+
+
+Fingerprint = namedtuple('Fingerprint', ['size', 'mtime', 'digest'])
+
+# end of central directory record
+_EOCD_SIGNATURE = b'PK\x05\x06'
+_EOCD_STRUCT = struct.Struct('<4s4H2LH')
+_EOCD_MAX_SIZE = _EOCD_STRUCT.size + 0xffff  # trailing comment of up to 64 KiB
+
+# ZIP64 end of central directory locator and record
+_ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+_ZIP64_LOCATOR_STRUCT = struct.Struct('<4sLQL')
+_ZIP64_EOCD_SIGNATURE = b'PK\x06\x06'
+_ZIP64_EOCD_STRUCT = struct.Struct('<4sQ2H2L4Q')
+
+
+def _central_directory(f, size):
+    """Locate the central directory of a ZIP file.
+
+    Parameters
+    ----------
+    f : file
+        ZIP file open in binary mode.
+    size : int
+        Size of the ZIP file.
+
+    Returns
+    -------
+    tuple
+        The pair (offset, size) of the central directory, None if the end
+        of central directory record cannot be found.
+
+    """
+    tail_size = min(size, _EOCD_MAX_SIZE)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    index = tail.rfind(_EOCD_SIGNATURE)
+    if index < 0 or index + _EOCD_STRUCT.size > len(tail):
+        return None
+    eocd = _EOCD_STRUCT.unpack_from(tail, index)
+    cd_size, cd_offset = eocd[5], eocd[6]
+
+    if cd_offset == 0xffffffff or cd_size == 0xffffffff:
+        locator_offset = size - tail_size + index - _ZIP64_LOCATOR_STRUCT.size
+        if locator_offset < 0:
+            return None
+        f.seek(locator_offset)
+        locator = _ZIP64_LOCATOR_STRUCT.unpack(f.read(_ZIP64_LOCATOR_STRUCT.size))
+        if locator[0] != _ZIP64_LOCATOR_SIGNATURE:
+            return None
+        f.seek(locator[2])
+        eocd64 = f.read(_ZIP64_EOCD_STRUCT.size)
+        if len(eocd64) < _ZIP64_EOCD_STRUCT.size:
+            return None
+        eocd64 = _ZIP64_EOCD_STRUCT.unpack(eocd64)
+        if eocd64[0] != _ZIP64_EOCD_SIGNATURE:
+            return None
+        cd_size, cd_offset = eocd64[8], eocd64[9]
+
+    return cd_offset, cd_size
+
+
+def zip_fingerprint(path):
+    """Fingerprint of a ZIP file.
+
+    The central directory lists name, size and CRC-32 of each member, so
+    its digest changes whenever the content changes, yet it is only a small
+    fraction of the ZIP file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the ZIP file.
+
+    Returns
+    -------
+    Fingerprint
+        Size, modification time and SHA-1 digest of the central directory.
+        If the central directory cannot be found, the digest is None.
+
+    """
+    st = os.stat(path)
+    digest = None
+    with open(path, 'rb') as f:
+        central_directory = _central_directory(f, st.st_size)
+        if central_directory:
+            offset, size = central_directory
+            f.seek(offset)
+            digest = hashlib.sha1(f.read(size)).hexdigest()
+    return Fingerprint(st.st_size, st.st_mtime, digest)
+
+
+class VerdictCache(object):
+    """Persistent cache of sanity check results for ZIP files.
+
+    Results are keyed by path and validated against the fingerprint of the
+    ZIP file, the parameters of the check and `CACHE_VERSION`. The cache is stored as a
+    JSON file.
+
+    Attributes
+    ----------
+    path : str
+        Path to the JSON file.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._verdicts = {}
+        self._modified = False
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self._verdicts = json.load(f)
+            except ValueError:
+                logger.error('%s: ignore invalid cache', path)
+
+    def get(self, path, fingerprint, parameters=None):
+        """Look up the cached result of a check.
+
+        Parameters
+        ----------
+        path : str
+            Path to the ZIP file.
+        fingerprint : Fingerprint
+            Current fingerprint of the ZIP file.
+        parameters : optional
+            JSON-serializable parameters of the check.
+
+        Returns
+        -------
+        object
+            Cached result, None if missing or out of date.
+
+        """
+        verdict = self._verdicts.get(os.path.abspath(path))
+        if (verdict and fingerprint.digest and
+                verdict.get('version') == CACHE_VERSION and
+                Fingerprint(*verdict['fingerprint']) == fingerprint and
+                verdict['parameters'] == parameters):
+            return verdict['result']
+        return None
+
+    def set(self, path, fingerprint, result, parameters=None):
+        """Store the result of a check.
+
+        Parameters
+        ----------
+        path : str
+            Path to the ZIP file.
+        fingerprint : Fingerprint
+            Fingerprint of the ZIP file at the time of the check.
+        result : object
+            JSON-serializable result of the check.
+        parameters : optional
+            JSON-serializable parameters of the check.
+
+        """
+        self._verdicts[os.path.abspath(path)] = {
+            'version': CACHE_VERSION,
+            'fingerprint': list(fingerprint),
+            'parameters': parameters,
+            'result': result,
+        }
+        self._modified = True
+
+    def save(self):
+        """Write the cache to its JSON file, if modified.
+
+        """
+        if not self._modified:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(prefix='.cveda-cache-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._verdicts, f, default=str)
+            os.rename(temp, self.path)
+        except BaseException:
+            os.remove(temp)
+            raise
+        self._modified = False
@@ -29,9 +29,17 @@
 # knowledge of the CeCILL license and that you accept its terms.
 
 import os
-import tempfile
-import shutil
+import time
+import random
+import threading
 import unicodedata
+from io import BytesIO
+from bisect import bisect_left
+from operator import attrgetter
+from collections import namedtuple
+from functools import partial
+from difflib import get_close_matches
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile
 try:
     from zipfile import BadZipFile
@@ -45,7 +53,8 @@ from ..dicom_utils import read_metadata
 import logging
 logger = logging.getLogger(__name__)
 
-__all__ = ['check_zip_name', 'check_zip_content', 'ZipTree']
+__all__ = ['check_zip_name', 'check_zip_content', 'ZipTree', 'CompactZipTree',
+           'ZipTreeSummary', 'Sampling']
 
 
 def _check_psc1(subject_id, suffix=None, psc1=None):
@@ -108,7 +117,117 @@ def check_zip_name(path, timepoint=None, psc1=None):
         return None, [Error(basename, 'Not a valid ZIP file name')]
 
 
-class ZipTree:
+ZipTreeSummary = namedtuple('ZipTreeSummary',
+                            ['count', 'empty', 'compress_size', 'file_size'])
+
+
+class _ZipTreeBase(object):
+    """Operations shared by tree structures representing ZipFile contents.
+
+    Derived classes provide attributes `filename`, `directories` and `files`.
+
+    """
+    __slots__ = ()
+
+    def walk_zipinfo(self):
+        """Iterate over files under this node, at any depth.
+
+        The tree is traversed iteratively, files of a node first, then
+        subdirectories depth first.
+
+        Yields
+        ------
+        zipinfo: ZipInfo
+
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for zipinfo in node.files.values():
+                yield zipinfo
+            stack.extend(reversed(list(node.directories.values())))
+
+    def walk_files(self):
+        """Iterate over path names of files under this node, at any depth.
+
+        Yields
+        ------
+        f: str
+
+        """
+        for zipinfo in self.walk_zipinfo():
+            yield zipinfo.filename
+
+    def empty_files(self):
+        """Iterate over empty files under this node, at any depth.
+
+        Yields
+        ------
+        zipinfo: ZipInfo
+
+        """
+        for zipinfo in self.walk_zipinfo():
+            if zipinfo.file_size == 0:
+                yield zipinfo
+
+    def summary(self):
+        """Summarize files under this node, at any depth, in a single pass.
+
+        Returns
+        -------
+        ZipTreeSummary
+            Number of files, list of empty files, total compressed size and
+            total uncompressed size.
+
+        """
+        count = 0
+        empty = []
+        compress_size = 0
+        file_size = 0
+        for zipinfo in self.walk_zipinfo():
+            count += 1
+            if zipinfo.file_size == 0:
+                empty.append(zipinfo)
+            compress_size += zipinfo.compress_size
+            file_size += zipinfo.file_size
+        return ZipTreeSummary(count, empty, compress_size, file_size)
+
+    def pprint(self, indent=''):
+        self._print_children(indent)
+
+    def _print_children(self, indent=''):
+        directories = list(self.directories.items())
+        if directories:
+            last_directory = directories.pop()
+            for d, ziptree in directories:
+                ziptree._print(d, indent, False)  # pylint: disable=W0212
+        else:
+            last_directory = None
+        files = list(self.files.items())
+        if files:
+            if last_directory:
+                d, ziptree = last_directory
+                ziptree._print(d, indent, False)  # pylint: disable=W0212
+            last_file = files.pop()
+            for f, dummy_zipinfo in files:
+                print(indent + '├── ' + f)
+            f, dummy_zipinfo = last_file
+            print(indent + '└── ' + f)
+        elif last_directory:
+            d, ziptree = last_directory
+            ziptree._print(d, indent)  # pylint: disable=W0212
+
+    def _print(self, name, indent='', last=True):
+        if last:
+            print(indent + '└── ' + name)
+            indent += '    '
+        else:
+            print(indent + '├── ' + name)
+            indent += '│   '
+        self._print_children(indent)
+
+
+class ZipTree(_ZipTreeBase):
     """Node of a tree structure to represent ZipFile contents.
 
     Attributes
@@ -119,6 +238,7 @@ class ZipTree:
         Dictionary of files under this node.
 
     """
+    __slots__ = ('filename', 'directories', 'files')
 
     def __init__(self, filename=''):
         self.filename = filename
@@ -127,10 +247,14 @@ class ZipTree:
 
     @staticmethod
     def create(path):
-        ziptree = ZipTree()
         with ZipFile(path, 'r') as z:
-            for zipinfo in z.infolist():
-                ziptree._add(zipinfo)  # pylint: disable=W0212
+            return ZipTree.from_zipfile(z)
+
+    @staticmethod
+    def from_zipfile(zip_file):
+        ziptree = ZipTree()
+        for zipinfo in zip_file.infolist():
+            ziptree._add(zipinfo)  # pylint: disable=W0212
         return ziptree
 
     def _add(self, zipinfo):
@@ -154,94 +278,128 @@ class ZipTree:
             else:
                 raise BadZipFile('duplicate file entry in zipfile')
 
-    def pprint(self, indent=''):
-        self._print_children(indent)
 
-    def _print_children(self, indent=''):
-        directories = list(self.directories.items())
-        if directories:
-            last_directory = directories.pop()
-            for d, ziptree in directories:
-                ziptree._print(d, indent, False)  # pylint: disable=W0212
-        else:
-            last_directory = None
-        files = list(self.files.items())
-        if files:
-            if last_directory:
-                d, ziptree = last_directory
-                ziptree._print(d, indent, False)  # pylint: disable=W0212
-            last_file = files.pop()
-            for f, dummy_zipinfo in files:
-                print(indent + '├── ' + f)
-            f, dummy_zipinfo = last_file
-            print(indent + '└── ' + f)
-        elif last_directory:
-            d, ziptree = last_directory
-            ziptree._print(d, indent)  # pylint: disable=W0212
+class CompactZipTree(_ZipTreeBase):
+    """Node of a compact tree structure to represent ZipFile contents.
 
-    def _print(self, name, indent='', last=True):
-        if last:
-            print(indent + '└── ' + name)
-            indent += '    '
-        else:
-            print(indent + '├── ' + name)
-            indent += '│   '
-        self._print_children(indent)
+    All nodes share a single array of ZipInfo objects sorted by name. A node
+    is a range of this array, where all names start with the name of the
+    node. Subdirectories and files of a node are computed when first
+    accessed, by bisecting the array.
 
+    Attributes
+    ----------
+    directories : dict
+        Dictionary of subdirectories.
+    files : str
+        Dictionary of files under this node.
 
-class TemporaryDirectory(object):
-    """Backport from Python 3.
     """
-    def __init__(self, suffix='', prefix=tempfile.gettempprefix(), dir=None):
-        self.pathname = tempfile.mkdtemp(suffix, prefix, dir)
+    __slots__ = ('filename', '_names', '_infos', '_lo', '_hi',
+                 '_directories', '_files')
 
-    def __repr__(self):
-        return '<{} {!r}>'.format(self.__class__.__name__, self.name)
-
-    def __enter__(self):
-        return self.pathname
-
-    def __exit__(self, exc, value, tb):
-        shutil.rmtree(self.pathname)
-
-
-def _files(ziptree):
-    """List files in a ZipTree.
+    def __init__(self, names, infos, lo, hi, filename=''):
+        self.filename = filename
+        self._names = names
+        self._infos = infos
+        self._lo = lo
+        self._hi = hi
+        self._directories = None
+        self._files = None
 
-    Parameters
-    ----------
-    ziptree : ZipTree
+    @staticmethod
+    def create(path):
+        with ZipFile(path, 'r') as z:
+            return CompactZipTree.from_zipfile(z)
 
-    Yields
-    -------
-    f: str
+    @staticmethod
+    def from_zipfile(zip_file):
+        infos = sorted(zip_file.infolist(), key=attrgetter('filename'))
+        names = [zipinfo.filename for zipinfo in infos]
+        for previous, name in zip(names, names[1:]):
+            if name == previous and not name.endswith('/'):
+                raise BadZipFile('duplicate file entry in zipfile')
+        return CompactZipTree(names, infos, 0, len(names))
+
+    @property
+    def directories(self):
+        if self._directories is None:
+            self._split()
+        return self._directories
+
+    @property
+    def files(self):
+        if self._files is None:
+            self._split()
+        return self._files
+
+    def walk_zipinfo(self):
+        """Iterate over files under this node, at any depth.
+
+        Files are listed in the order of the sorted array, without
+        building intermediate nodes.
+
+        Yields
+        ------
+        zipinfo: ZipInfo
+
+        """
+        for i in range(self._lo, self._hi):
+            if not self._names[i].endswith('/'):  # skip directories
+                yield self._infos[i]
+
+    def _split(self):
+        directories = {}
+        files = {}
+        names = self._names
+        start = len(self.filename)
+        i = self._lo
+        while i < self._hi:
+            name = names[i]
+            slash = name.find('/', start)
+            if slash < 0:
+                if len(name) > start:  # skip entry of the node itself
+                    files[name[start:]] = self._infos[i]
+                i += 1
+            else:
+                # names of the subdirectory are contiguous and sort
+                # before the name followed by '0', next to '/' in ASCII
+                dirname = name[:slash + 1]
+                end = bisect_left(names, name[:slash] + '0', i, self._hi)
+                directories[name[start:slash]] = CompactZipTree(
+                    names, self._infos, i, end, dirname)
+                i = end
+        self._directories = directories
+        self._files = files
 
-    """
-    for f in ziptree.files:
-        yield ziptree.filename + f
-    for ziptree in ziptree.directories.values():
-        for f in _files(ziptree):
-            yield f
 
+def _open_member(zip_file, name):
+    """Open a member of a ZIP file as a seekable file object.
 
-def _check_empty_files(ziptree):
-    """Recursively check for empty files in a ZipTree.
+    Members of ZIP files are seekable starting with Python 3.7, otherwise
+    read the member into memory.
 
     Parameters
     ----------
-    ziptree : ZipTree
+    zip_file : ZipFile
+    name : str
+        Name of the member.
 
-    Yields
+    Returns
     -------
-    error: Error
+    file-like
 
     """
-    for zipinfo in ziptree.files.values():
-        if zipinfo.file_size == 0:
-            yield Error(zipinfo.filename, 'File is empty')
-    for ziptree in ziptree.directories.values():
-        for error in _check_empty_files(ziptree):
-            yield error
+    member = zip_file.open(name)
+    try:
+        seekable = member.seekable()
+    except AttributeError:  # Python 2
+        seekable = False
+    if seekable:
+        return member
+    else:
+        with member:
+            return BytesIO(member.read())
 
 
 _SERIES_DESCRIPTION = {
@@ -300,19 +458,95 @@ _SERIES_DESCRIPTION = {
 }
 
 
-def _match_series_description(sequence, series_description, center=None):
-    _SHORT_SERIES_DESCRIPTION = {}
+def _normalize_series_description(series_description):
+    """Normalize case and whitespace of a Series Description.
+
+    """
+    return ' '.join(series_description.split()).upper()
+
+
+def _compile_series_descriptions(series_descriptions):
+    """Build reverse indexes of Series Descriptions.
+
+    Each Series Description maps to the set of pairs (center, sequence)
+    it is expected for. It also maps to pairs (None, sequence), so that
+    any acquisition centre can be matched with a single lookup.
+
+    Parameters
+    ----------
+    series_descriptions : dict
+        Expected Series Descriptions, for each sequence of each centre.
+
+    Returns
+    -------
+    tuple
+        Exact and normalized reverse indexes.
+
+    """
+    exact = {}
+    normalized = {}
+    for center, sequences in series_descriptions.items():
+        for sequence, descriptions in sequences.items():
+            for description in descriptions:
+                for key, index in ((description, exact),
+                                   (_normalize_series_description(description),
+                                    normalized)):
+                    matches = index.setdefault(key, set())
+                    matches.add((center, sequence))
+                    matches.add((None, sequence))
+    return exact, normalized
+
+
+_SERIES_DESCRIPTION_INDEX, _NORMALIZED_SERIES_DESCRIPTION_INDEX = \
+    _compile_series_descriptions(_SERIES_DESCRIPTION)
+
+# similarity ratio for fuzzy matching of Series Descriptions
+_FUZZY_CUTOFF = 0.9
+
+_MATCHING = ('exact', 'normalized', 'fuzzy')
+
+
+def _match_series_description(sequence, series_description, center=None,
+                              matching='exact'):
+    """Check a Series Description is expected for a sequence.
+
+    Parameters
+    ----------
+    sequence : str
+        Expected sequence.
+    series_description : str
+        Series Description read from DICOM file.
+    center : str, optional
+        Acquisition centre. By default any centre is accepted.
+    matching : str
+        How to compare Series Descriptions:
+        * 'exact' - exact match,
+        * 'normalized' - ignore case and differences in whitespace,
+        * 'fuzzy' - in addition allow minor differences.
 
-    if center:
-        if center in _SHORT_SERIES_DESCRIPTION:
-            series = _SHORT_SERIES_DESCRIPTION[center]
-            if sequence in series and series_description in series[sequence]:
-                return True
+    Returns
+    -------
+    bool
+
+    Raises
+    ------
+    ValueError
+        If the matching mode is unknown.
+
+    """
+    if matching not in _MATCHING:
+        raise ValueError('unknown matching mode: {0}'.format(matching))
+    if matching == 'exact':
+        matches = _SERIES_DESCRIPTION_INDEX.get(series_description, ())
     else:
-        for series in _SERIES_DESCRIPTION.values():
-            if sequence in series and series_description in series[sequence]:
-                return True
-    return False
+        key = _normalize_series_description(series_description)
+        matches = _NORMALIZED_SERIES_DESCRIPTION_INDEX.get(key, ())
+        if not matches and matching == 'fuzzy':
+            for close in get_close_matches(key, _NORMALIZED_SERIES_DESCRIPTION_INDEX,
+                                           n=3, cutoff=_FUZZY_CUTOFF):
+                if (center, sequence) in _NORMALIZED_SERIES_DESCRIPTION_INDEX[close]:
+                    return True
+    return (center, sequence) in matches
 
 
 def _filter_non_printable(s):
@@ -344,13 +578,170 @@ def _filter_non_printable(s):
         return ''.join(translate(c) for c in s)
 
 
-def _check_sequence_content(path, ziptree, sequence, psc1, date):
+class Sampling(object):
+    """Policy to choose which DICOM files of a sequence to check.
+
+    Only DICOM headers are read. Files that cannot be read are replaced by
+    the next candidate. When more than one file is checked, files are also
+    compared with the first file checked, to detect sequences mixing
+    subjects or acquisition dates.
+
+    Parameters
+    ----------
+    mode : str
+        * 'first' - check the first readable file (default),
+        * 'ends' - check the first, middle and last files,
+        * 'random' - check `count` files chosen at random,
+        * 'all' - check all files.
+    count : int, optional
+        Number of files to check in 'random' mode.
+    seconds : float, optional
+        Time budget for checking a ZIP file.
+    size : int, optional
+        Budget of DICOM header bytes read from a ZIP file.
+    seed : int, optional
+        Seed of the random number generator in 'random' mode.
+
+    Budgets are shared by all sequences of a ZIP file. Once exhausted, no
+    more files are checked, except that at least one file is checked for
+    each sequence.
+
+    """
+    MODES = ('first', 'ends', 'random', 'all')
+
+    def __init__(self, mode='first', count=1, seconds=None, size=None, seed=None):
+        if mode not in self.MODES:
+            raise ValueError('unknown sampling mode: {0}'.format(mode))
+        if count < 1:
+            raise ValueError('invalid sampling count: {0}'.format(count))
+        self.mode = mode
+        self.count = count
+        self.seconds = seconds
+        self.size = size
+        self.seed = seed
+
+    def select(self, files):
+        """Order files to check by priority.
+
+        Parameters
+        ----------
+        files : list
+            Files of a sequence, in archive order.
+
+        Returns
+        -------
+        tuple
+            The pair (candidates, n) where candidates is the list of files
+            ordered by priority, and n the number of files to check.
+
+        """
+        if not files:
+            return [], 0
+        elif self.mode == 'first':
+            return files, 1
+        elif self.mode == 'ends':
+            ends = sorted({0, len(files) // 2, len(files) - 1})
+            candidates = [files[i] for i in ends]
+            candidates.extend(f for i, f in enumerate(files) if i not in ends)
+            return candidates, len(ends)
+        elif self.mode == 'random':
+            candidates = list(files)
+            random.Random(self.seed).shuffle(candidates)
+            return candidates, self.count
+        else:
+            return files, len(files)
+
+    def budget(self):
+        """Create a budget for checking a ZIP file.
+
+        Returns
+        -------
+        _Budget
+
+        """
+        return _Budget(self.seconds, self.size)
+
+
+class _Budget(object):
+    """Time and size budget for checking a ZIP file, shared by threads.
+
+    """
+
+    def __init__(self, seconds=None, size=None):
+        self._deadline = None if seconds is None else time.time() + seconds
+        self._size = size
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        if self._size is not None:
+            with self._lock:
+                self._size -= size
+
+    def exhausted(self):
+        if self._deadline is not None and time.time() > self._deadline:
+            return True
+        return self._size is not None and self._size <= 0
+
+
+def _check_metadata(f, metadata, sequence, psc1, date, center, matching):
+    """Check DICOM metadata of the first file checked in a sequence.
+
+    """
+    error_list = []
+
+    series_description = metadata['SeriesDescription']
+    if not _match_series_description(sequence, series_description,
+                                     center, matching):
+        error_list.append(Error(f, 'Unexpected Series Description: {0}'
+                               .format(series_description)))
+    if 'PatientID' in metadata:
+        patient_id = metadata['PatientID']
+        if not patient_id:
+            error_list.append(Error(f, 'Empty PSC1 code'))
+        elif patient_id != psc1:
+            patient_id = _filter_non_printable(patient_id)
+            error_list.append(Error(f, 'Inconsistent PSC1 code: {0}'
+                                   .format(patient_id)))
+    else:
+        error_list.append(Error(f, 'Missing PSC1 code'))
+    if 'AcquisitionDate' in metadata:
+        if date:
+            acquisition_date = metadata['AcquisitionDate']
+            if acquisition_date != date:
+                error_list.append(Error(f, 'Inconsistent acquisition date: {0}'
+                                       .format(acquisition_date)))
+    else:
+        error_list.append(Error(f, 'Missing acquisition date'))
+
+    return error_list
+
+
+def _check_mixed_metadata(f, metadata, reference):
+    """Compare DICOM metadata of other files checked in a sequence.
+
+    """
+    error_list = []
+
+    if metadata.get('PatientID') != reference.get('PatientID'):
+        patient_id = _filter_non_printable(metadata.get('PatientID') or '')
+        error_list.append(Error(f, 'Mixed PSC1 codes in sequence: {0}'
+                               .format(patient_id)))
+    if metadata.get('AcquisitionDate') != reference.get('AcquisitionDate'):
+        error_list.append(Error(f, 'Mixed acquisition dates in sequence: {0}'
+                               .format(metadata.get('AcquisitionDate'))))
+
+    return error_list
+
+
+def _check_sequence_content(zip_file, ziptree, sequence, psc1, date,
+                            center=None, matching='exact',
+                            sampling=None, budget=None):
     """Rapid sanity check of a ZIP subfolder containing an MRI sequence.
 
     Parameters
     ----------
-    path : str
-        Path name of the ZIP file.
+    zip_file : ZipFile
+        Open ZIP file.
     ziptree : ZipTree
         Tree under the specific sequence folder.
     sequence : str
@@ -359,66 +750,110 @@ def _check_sequence_content(path, ziptree, sequence, psc1, date):
         Expected 12-digit PSC1 code.
     date : datetime.date
         Expected date of acquisition.
+    center : str, optional
+        Acquisition centre.
+    matching : str
+        How to compare Series Descriptions, see `_match_series_description`.
+    sampling : Sampling, optional
+        Which DICOM files to check, by default the first readable file.
+    budget : _Budget, optional
+        Time and size budget shared by all sequences of the ZIP file.
 
     Returns
     -------
     result: tuple
-        In case of errors, return the tuple ([], errors) where errors is
-        a list of errors. Otherwise return the tuple (psc1, errors) where psc1
-        is a list of detected PSC1 code and errors is an empty list.
+        The tuple (psc1, errors) where psc1 is the set of PSC1 codes found
+        in the DICOM files checked and errors is a list of errors, empty if
+        the sequence passes the check.
 
     """
     subject_ids = set()
     error_list = []
 
-    # check zip tree is not empty and does not contain empty files
-    files = list(_files(ziptree))
-    if len(files) < 1:
+    # check zip tree is not empty - empty files are checked by the caller
+    zipinfos = list(ziptree.walk_zipinfo())
+    if len(zipinfos) < 1:
         error_list.append(Error(ziptree.filename, 'Folder is empty'))
     else:
-        error_list.extend(_check_empty_files(ziptree))
-
-        # choose a file from zip tree and check its DICOM tags
-        with TemporaryDirectory('cveda') as tempdir:
-            for f in files:
-                with ZipFile(path, 'r') as z:
-                    dicom_file = z.extract(f, tempdir)
-                    try:
-                        metadata = read_metadata(dicom_file, force=True)
-                    except IOError:
-                        continue
-                    except AttributeError:
-                        error_list.append(Error(f, 'This is not a valid DICOM file'))
-                        break
-                    else:
-                        series_description = metadata['SeriesDescription']
-                        if not _match_series_description(sequence, series_description):
-                            error_list.append(Error(f, 'Unexpected Series Description: {0}'
-                                                   .format(series_description)))
-                        if 'PatientID' in metadata:
-                            patient_id = metadata['PatientID']
-                            if not patient_id:
-                                error_list.append(Error(f, 'Empty PSC1 code'))
-                            elif patient_id != psc1:
-                                patient_id = _filter_non_printable(patient_id)
-                                error_list.append(Error(f, 'Inconsistent PSC1 code: {0}'
-                                                       .format(patient_id)))
-                        else:
-                            error_list.append(Error(f, 'Missing PSC1 code'))
-                        if 'AcquisitionDate' in metadata:
-                            if date:
-                                acquisition_date = metadata['AcquisitionDate']
-                                if acquisition_date != date:
-                                    error_list.append(Error(f, 'Inconsistent acquisition date: {0}'
-                                                           .format(acquisition_date)))
-                        else:
-                            error_list.append(Error(f, 'Missing acquisition date'))
-                        break
+        # choose files from zip tree and check their DICOM tags
+        # read DICOM headers straight from the open ZIP file
+        if sampling is None:
+            sampling = Sampling()
+        # empty files are already reported, do not read them again
+        files = [zipinfo.filename for zipinfo in zipinfos if zipinfo.file_size]
+        candidates, n = sampling.select(files)
+        checked = 0
+        reference = None
+        for f in candidates:
+            if checked >= n:
+                break
+            if checked and budget is not None and budget.exhausted():
+                break
+            with _open_member(zip_file, f) as dicom_file:
+                try:
+                    metadata = read_metadata(dicom_file, force=True,
+                                             center=center)
+                except IOError:
+                    continue
+                except AttributeError:
+                    error_list.append(Error(f, 'This is not a valid DICOM file'))
+                    checked += 1
+                    continue
+                finally:
+                    if budget is not None:
+                        budget.consume(dicom_file.tell())
+            if metadata.get('PatientID'):
+                subject_ids.add(metadata['PatientID'])
+            if reference is None:
+                reference = metadata
+                error_list.extend(_check_metadata(f, metadata, sequence, psc1,
+                                                  date, center, matching))
+            else:
+                error_list.extend(_check_mixed_metadata(f, metadata, reference))
+            checked += 1
 
     return subject_ids, error_list
 
 
-def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None):
+def _check_sequences(path, zip_file, sequences, check, workers=None):
+    """Check ZIP subfolders containing MRI sequences, possibly concurrently.
+
+    Parameters
+    ----------
+    path : str
+        Path to the ZIP file.
+    zip_file : ZipFile
+        Open ZIP file.
+    sequences : list
+        List of pairs (sequence, ziptree).
+    check : callable
+        Called as check(zip_file, ziptree, sequence) to check a sequence.
+    workers : int, optional
+        Number of threads checking sequences concurrently.
+
+    Returns
+    -------
+    dict
+        Maps each sequence to the result of `check`.
+
+    """
+    if workers and workers > 1 and len(sequences) > 1:
+        def check_own_zip_file(sequence, ziptree):
+            # each thread reads from its own ZipFile object
+            with ZipFile(path, 'r') as z:
+                return check(z, ziptree, sequence)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(sequence, executor.submit(check_own_zip_file, sequence, ziptree))
+                       for sequence, ziptree in sequences]
+            return {sequence: future.result() for sequence, future in futures}
+    else:
+        return {sequence: check(zip_file, ziptree, sequence)
+                for sequence, ziptree in sequences}
+
+
+def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None,
+                      center=None, matching='exact', sampling=None, workers=None):
     """Rapid sanity check of a ZIP file containing imaging data for a subject.
 
     Expected sequences and tests are described as a dict:
@@ -445,6 +880,21 @@ def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None)
         Date of acquisition.
     expected : dict, optional
         Which MRI sequences and tests to expect.
+    center : str, optional
+        Acquisition centre. If known, expect the Series Descriptions of this
+        centre only, and look for the PSC1 code in the DICOM tags used by
+        this centre only.
+    matching : str, optional
+        How to compare Series Descriptions with expected values:
+        'exact' (default), 'normalized' to ignore case and differences in
+        whitespace, or 'fuzzy' to also allow minor differences.
+    sampling : Sampling, optional
+        Which DICOM files to check in each sequence folder, and time or
+        size budget for the whole ZIP file. By default check the first
+        readable DICOM file of each sequence folder.
+    workers : int, optional
+        Number of threads checking sequence folders concurrently. Errors
+        are reported in the same order as with sequential checks.
 
     Returns
     -------
@@ -458,8 +908,15 @@ def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None)
     ------
     FileNotFoundError
         If the file does not exist.
+    ValueError
+        If the acquisition centre or the matching mode is unknown.
 
     """
+    if center is not None and center not in _SERIES_DESCRIPTION:
+        raise ValueError('unknown acquisition centre: {0}'.format(center))
+    if matching not in _MATCHING:
+        raise ValueError('unknown matching mode: {0}'.format(matching))
+
     subject_ids = []
     error_list = []
 
@@ -471,36 +928,58 @@ def check_zip_content(path, timepoint=None, psc1=None, date=None, expected=None)
         return (subject_ids, error_list)
 
     # read the ZIP file into a tree structure
+    # the ZIP file is opened once and shared by all checks
     try:
-        ziptree = ZipTree.create(path)
+        zip_file = ZipFile(path, 'r')
     except BadZipFile as e:
         error_list.append(Error(basename, 'Cannot unzip: "{0}"'.format(e)))
         return (subject_ids, error_list)
 
-    # check tree structure
-    for f, z in ziptree.files.items():
-        error_list.append(Error(f, 'Unexpected file at the root of the ZIP file: {0}'
-                               .format(f)))
-
-    if expected:
-        for sequence, status in expected.items():
-            if status != 'Missing' and sequence not in ziptree.directories:
-                error_list.append(Error(basename,
-                                    'Missing folder at the root of the ZIP file: {0}'
-                                    .format(sequence)))
-        for d, z in ziptree.directories.items():
-            if d not in expected:
-                error_list.append(Error(basename,
-                                    'Unexpected folder, unrelated to expected sequences: {0}'
-                                    .format(d)))
-            elif expected[d] == 'Missing':
-                error_list.append(Error(basename,
-                                    'Unexpected folder, associated to a "Missing" sequence: {0}'
-                                    .format(d)))
-            else:
-                s, e = _check_sequence_content(path, z, d, psc1, date)
-                subject_ids.extend(s)
-                error_list.extend(e)
-            error_list.extend(_check_empty_files(z))
+    with zip_file:
+        try:
+            ziptree = CompactZipTree.from_zipfile(zip_file)
+        except BadZipFile as e:
+            error_list.append(Error(basename, 'Cannot unzip: "{0}"'.format(e)))
+            return (subject_ids, error_list)
+
+        # check tree structure
+        for f, z in ziptree.files.items():
+            error_list.append(Error(f, 'Unexpected file at the root of the ZIP file: {0}'
+                                   .format(f)))
+
+        if expected:
+            for sequence, status in expected.items():
+                if status != 'Missing' and sequence not in ziptree.directories:
+                    error_list.append(Error(basename,
+                                        'Missing folder at the root of the ZIP file: {0}'
+                                        .format(sequence)))
+            sequences = [(d, z) for d, z in ziptree.directories.items()
+                         if d in expected and expected[d] != 'Missing']
+            if sampling is None:
+                sampling = Sampling()
+            check = partial(_check_sequence_content, psc1=psc1, date=date,
+                            center=center, matching=matching,
+                            sampling=sampling, budget=sampling.budget())
+            results = _check_sequences(path, zip_file, sequences, check,
+                                       workers)
+            for d, z in ziptree.directories.items():
+                if d not in expected:
+                    error_list.append(Error(basename,
+                                        'Unexpected folder, unrelated to expected sequences: {0}'
+                                        .format(d)))
+                elif expected[d] == 'Missing':
+                    error_list.append(Error(basename,
+                                        'Unexpected folder, associated to a "Missing" sequence: {0}'
+                                        .format(d)))
+                else:
+                    s, e = results[d]
+                    subject_ids.extend(s)
+                    error_list.extend(e)
+                summary = z.summary()
+                logger.debug('%s: %d files, %d bytes, %d bytes compressed',
+                             z.filename, summary.count,
+                             summary.file_size, summary.compress_size)
+                error_list.extend(Error(zipinfo.filename, 'File is empty')
+                                  for zipinfo in summary.empty)
 
     return subject_ids, error_list
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import os
+import zlib
+from zipfile import ZipFile
+try:
+    from zipfile import BadZipFile
+except ImportError:
+    from zipfile import BadZipfile as BadZipFile  # Python 2
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core import Error
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = ['check_zip_integrity']
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _check_members(path, members):
+    """Verify the CRC-32 of members of a ZIP file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the ZIP file.
+    members : list
+        List of pairs (index, ZipInfo).
+
+    Returns
+    -------
+    list
+        List of pairs (index, error) for corrupt members.
+
+    """
+    errors = []
+    with ZipFile(path, 'r') as z:
+        for index, zipinfo in members:
+            try:
+                # the CRC-32 is verified once the end of member is read
+                with z.open(zipinfo) as f:
+                    while f.read(_CHUNK_SIZE):
+                        pass
+            except (BadZipFile, zlib.error, EOFError, IOError,
+                    NotImplementedError, RuntimeError) as e:
+                errors.append((index, Error(zipinfo.filename,
+                                            'Corrupt file: "{0}"'.format(e))))
+    return errors
+
+
+def _split_members(infolist, n):
+    """Split members of a ZIP file into groups of similar compressed size.
+
+    Parameters
+    ----------
+    infolist : list
+        List of ZipInfo.
+    n : int
+        Number of groups.
+
+    Returns
+    -------
+    list
+        Groups of pairs (index, ZipInfo), members in archive order within
+        each group.
+
+    """
+    groups = [[] for i in range(n)]
+    sizes = [0] * n
+    # largest members first, each into the least loaded group
+    for index, zipinfo in sorted(enumerate(infolist),
+                                 key=lambda x: x[1].compress_size,
+                                 reverse=True):
+        i = sizes.index(min(sizes))
+        groups[i].append((index, zipinfo))
+        sizes[i] += zipinfo.compress_size
+    # read each ZIP file sequentially
+    return [sorted(group, key=lambda x: x[1].header_offset)
+            for group in groups if group]
+
+
+def check_zip_integrity(path, workers=None):
+    """Verify the integrity of a ZIP file without extracting it.
+
+    Each member is decompressed in memory and its CRC-32 verified. Nothing
+    is written to disk. Unlike ZipFile.testzip(), all corrupt members are
+    reported.
+
+    Parameters
+    ----------
+    path : str
+        Path to the ZIP file.
+    workers : int, optional
+        Number of threads decompressing members concurrently, each with
+        its own ZipFile object. By default members are read sequentially.
+
+    Returns
+    -------
+    list
+        List of errors, empty if the ZIP file is intact.
+
+    """
+    basename = os.path.basename(path)
+
+    try:
+        with ZipFile(path, 'r') as z:
+            infolist = [zipinfo for zipinfo in z.infolist()
+                        if not zipinfo.filename.endswith('/')]
+    except (BadZipFile, IOError) as e:
+        return [Error(basename, 'Cannot unzip: "{0}"'.format(e))]
+
+    if workers and workers > 1 and len(infolist) > 1:
+        groups = _split_members(infolist, workers)
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [executor.submit(_check_members, path, group)
+                       for group in groups]
+            errors = [error for future in futures for error in future.result()]
+    else:
+        errors = _check_members(path, list(enumerate(infolist)))
+
+    # report errors in archive order
+    return [error for index, error in sorted(errors, key=lambda x: x[0])]
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import os
+import zlib
+try:
+    from zipfile import BadZipFile
+except ImportError:
+    from zipfile import BadZipfile as BadZipFile  # Python 2
+from concurrent.futures import ProcessPoolExecutor
+
+from .imaging import check_zip_name
+from .imaging import check_zip_content
+from .integrity import check_zip_integrity
+from .cache import zip_fingerprint
+from ..core import Error
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = ['check_quarantine']
+
+
+def _original_filename(filename):
+    """Recover the original name of a ZIP file in the quarantine directory.
+
+    The upload portal prefixes an increment and appends 6 characters to
+    the name of uploaded files: <increment>_data_<name><6 characters>.zip
+
+    Parameters
+    ----------
+    filename : str
+        Name of the ZIP file in the quarantine directory.
+
+    Returns
+    -------
+    str
+        Name of the ZIP file as uploaded, None if it cannot be recovered.
+
+    """
+    root, ext = os.path.splitext(filename)
+    if '_data_' not in root:
+        return None
+    increment, suffix = root.split('_data_', 1)
+    if not increment.isdigit() or len(suffix) <= 6:
+        return None
+    return suffix[:-6] + ext
+
+
+def _error_to_dict(error):
+    return {
+        'path': error.path,
+        'message': error.message,
+        'sample': error.sample,
+    }
+
+
+def _record(filename, subject_ids, error_list):
+    return {
+        'filename': filename,
+        'psc1': sorted(set(subject_ids)),
+        'errors': [_error_to_dict(e) for e in error_list],
+    }
+
+
+def _check_quarantine_file(path, expected=None, integrity=False,
+                           center=None, matching='exact', sampling=None):
+    """Check name and content of a ZIP file in the quarantine directory.
+
+    Parameters
+    ----------
+    path : str
+        Path to the ZIP file.
+    expected : dict, optional
+        Which MRI sequences and tests to expect.
+    center : str, optional
+        Acquisition centre, see :py:func:`check_zip_content`.
+    matching : str, optional
+        How to compare Series Descriptions, see :py:func:`check_zip_content`.
+    sampling : Sampling, optional
+        Which DICOM files to check, see :py:func:`check_zip_content`.
+    integrity : bool, optional
+        If True, first verify the CRC-32 of each member of the ZIP file,
+        and check content only if all members are intact.
+
+    Returns
+    -------
+    dict
+        Record with the name of the ZIP file, the PSC1 codes found in the
+        ZIP file and the list of errors as dictionaries.
+
+    """
+    filename = os.path.basename(path)
+    subject_ids = []
+    error_list = []
+
+    original = _original_filename(filename)
+    if original is None:
+        error_list.append(Error(filename, 'Unexpected file name in quarantine'))
+    else:
+        # time point suffix follows the 12-digit PSC1 code
+        subject_id = os.path.splitext(original)[0]
+        if len(subject_id) > 12:
+            timepoint = subject_id[12:]
+        else:
+            timepoint = 'BL'
+        subject_id, errors = check_zip_name(original, timepoint)
+        error_list.extend(errors)
+        try:
+            if integrity:
+                errors = check_zip_integrity(path)
+                error_list.extend(errors)
+                intact = not errors
+                # content of a corrupt ZIP file cannot be checked reliably
+                if not intact:
+                    return _record(filename, subject_ids, error_list)
+            ids, errors = check_zip_content(path, timepoint, subject_id,
+                                            expected=expected, center=center,
+                                            matching=matching,
+                                            sampling=sampling)
+        except (IOError, OSError, BadZipFile, EOFError, zlib.error,
+                NotImplementedError, RuntimeError) as e:
+            # a corrupt member must not abort checks of other files
+            error_list.append(Error(filename, 'Cannot read file: {0}'.format(e)))
+        else:
+            subject_ids.extend(ids)
+            error_list.extend(errors)
+
+    return _record(filename, subject_ids, error_list)
+
+
+def check_quarantine(path, expected=None, workers=None, resume_after=None,
+                     cache=None, integrity=False, center=None,
+                     matching='exact', sampling=None):
+    """Check names and contents of all ZIP files in the quarantine directory.
+
+    Files are checked with :py:func:`check_zip_name` and
+    :py:func:`check_zip_content` in a pool of processes. Results are
+    generated in alphabetical order of file names, as soon as available.
+
+    Parameters
+    ----------
+    path : str
+        Quarantine directory.
+    expected : dict, optional
+        Which MRI sequences and tests to expect, see
+        :py:func:`check_zip_content`.
+    workers : int, optional
+        Number of processes checking ZIP files concurrently. By default
+        files are checked sequentially in the current process.
+    resume_after : str, optional
+        Skip files up to and including this file name, typically the last
+        file checked by an interrupted run.
+    cache : VerdictCache, optional
+        Results of previous checks. Files that have not changed since they
+        were last checked with the same parameters are not checked
+        again. New results are added to the cache, which is saved at the end.
+    integrity : bool, optional
+        If True, also verify the CRC-32 of each member of each ZIP file,
+        without writing anything to disk, see :py:func:`check_zip_integrity`.
+    center : str, optional
+        Acquisition centre, see :py:func:`check_zip_content`.
+    matching : str, optional
+        How to compare Series Descriptions, see :py:func:`check_zip_content`.
+    sampling : Sampling, optional
+        Which DICOM files to check, see :py:func:`check_zip_content`.
+
+    Yields
+    ------
+    dict
+        Record with the name of the ZIP file ('filename'), the PSC1 codes
+        found in the ZIP file ('psc1') and the list of errors ('errors'),
+        each error being a dictionary with keys 'path', 'message' and
+        'sample'.
+
+    """
+    filenames = sorted(f for f in os.listdir(path) if f.endswith('.zip'))
+    if resume_after:
+        filenames = [f for f in filenames if f > resume_after]
+    paths = [os.path.join(path, f) for f in filenames]
+
+    # look up unchanged files in the cache
+    parameters = {
+        'expected': expected,
+        'integrity': integrity,
+        'center': center,
+        'matching': matching,
+        'sampling': vars(sampling) if sampling else None,
+    }
+    cached = {}
+    fingerprints = {}
+    if cache is not None:
+        for p in paths:
+            try:
+                fingerprints[p] = zip_fingerprint(p)
+            except (IOError, OSError) as e:
+                logger.error('cannot read file (%s): %s', str(e), p)
+                continue
+            record = cache.get(p, fingerprints[p], parameters)
+            if record is not None:
+                cached[p] = record
+        logger.info('%d out of %d files found in cache', len(cached), len(paths))
+
+    def store(p, record):
+        if p in fingerprints:
+            cache.set(p, fingerprints[p], record, parameters)
+        return record
+
+    try:
+        if workers and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {p: executor.submit(_check_quarantine_file, p, expected,
+                                              integrity, center, matching,
+                                              sampling)
+                           for p in paths if p not in cached}
+                for p in paths:
+                    if p in cached:
+                        yield cached[p]
+                    else:
+                        yield store(p, futures[p].result())
+        else:
+            for p in paths:
+                if p in cached:
+                    yield cached[p]
+                else:
+                    yield store(p, _check_quarantine_file(p, expected, integrity,
+                                                          center, matching,
+                                                          sampling))
+    finally:
+        if cache is not None:
+            cache.save()
@@ -33,10 +33,21 @@ import os
 import zipfile
 import zlib
 import tempfile
+import time
 from datetime import datetime
+from collections import namedtuple, Counter
+from functools import lru_cache
 import shutil
 import subprocess
+import hashlib
+import argparse
+import contextlib
+import abc
+import multiprocessing
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait, as_completed, FIRST_COMPLETED)
 from cveda_databank import PSC2_FROM_PSC1
+from cveda_databank import diffusion_convention
 import json
 import logging
 logger = logging.getLogger(__name__)
@@ -67,6 +78,119 @@ def quarantine_filename_semantics(filename):
     return increment, psc1, timepoint
 
 
+ZipMember = namedtuple('ZipMember', ('filename', 'CRC', 'file_size'))
+
+ZipListing = namedtuple('ZipListing', ('size', 'mtime', 'digest', 'members'))
+
+
+def _members_digest(members, prefix=''):
+    """Digest of the name, CRC-32 and size of ZIP members.
+
+    Parameters
+    ----------
+    members : iterable of ZipMember
+    prefix : str, optional
+        Leading part of member names to leave out of the digest.
+
+    """
+    sha1 = hashlib.sha1()
+    for member in sorted(members):
+        sha1.update('{}\0{:08x}\0{}\n'.format(member.filename[len(prefix):],
+                                               member.CRC, member.file_size)
+                    .encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def read_zip_listing(path):
+    """Read the central directory of a ZIP file.
+
+    Parameters
+    ----------
+    path : str
+        ZIP file.
+
+    Returns
+    -------
+    ZipListing
+        Size and modification time of the ZIP file, digest of the name,
+        CRC-32 and size of its members, and list of its members.
+
+    Raises
+    ------
+    zipfile.BadZipFile
+        If the file is not a valid ZIP file.
+
+    """
+    st = os.stat(path)
+    with zipfile.ZipFile(path) as zip_file:
+        members = [ZipMember(zip_info.filename, zip_info.CRC,
+                             zip_info.file_size)
+                   for zip_info in zip_file.infolist()]
+    return ZipListing(st.st_size, st.st_mtime, _members_digest(members),
+                      members)
+
+
+def _is_current(listing, path):
+    st = os.stat(path)
+    return listing.size == st.st_size and listing.mtime == st.st_mtime
+
+
+class QuarantineScanner:
+    """Read the central directory of each ZIP file in quarantine once.
+
+    Listings are cached by path and are read again only if the size or
+    modification time of the ZIP file changes. The cache can be saved
+    to a JSON file and reused by the next run. Only ZIP files that still
+    exist and have been scanned in the current run are saved.
+
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._listings = {}
+        self._seen = set()
+        if path:
+            try:
+                with open(path) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+            for zip_path, (size, mtime, digest, members) in cache.items():
+                if not os.path.isfile(zip_path):
+                    continue  # removed from quarantine
+                self._listings[zip_path] = ZipListing(
+                    size, mtime, digest, [ZipMember(*m) for m in members])
+
+    def listing(self, zip_path):
+        """Listing of a ZIP file, read from the cache if up to date.
+
+        Raises
+        ------
+        zipfile.BadZipFile
+            If the file is not a valid ZIP file.
+
+        """
+        self._seen.add(zip_path)
+        listing = self._listings.get(zip_path)
+        if listing is None or not _is_current(listing, zip_path):
+            listing = read_zip_listing(zip_path)
+            self._listings[zip_path] = listing
+        return listing
+
+    def save(self):
+        """Save listings of ZIP files scanned in this run.
+
+        """
+        if not self.path:
+            return
+        cache = {zip_path: listing
+                 for zip_path, listing in self._listings.items()
+                 if zip_path in self._seen and os.path.isfile(zip_path)}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(cache, f)
+        os.replace(self.path + '.tmp', self.path)
+
+
 def timestamps(top, include_dirs=True):
     min_timestamp = datetime.max
     max_timestamp = datetime.min
@@ -87,17 +211,22 @@ def timestamps(top, include_dirs=True):
     return (min_timestamp, max_timestamp)
 
 
-def list_datasets(path):
+def list_datasets(path, scanner=None):
+    if scanner is None:
+        scanner = QuarantineScanner()
+
     datasets = {}
 
     for zip_file in os.listdir(path):
         zip_path = os.path.join(path, zip_file)
-        if not zipfile.is_zipfile(zip_path):
+        try:
+            listing = scanner.listing(zip_path)
+        except (zipfile.BadZipFile, OSError):
             logger.warn('%s: skip invalid ZIP file ', zip_file)
             continue
 
         # Unix timestamp of the ZIP file
-        timestamp = os.path.getmtime(zip_path)
+        timestamp = listing.mtime
 
         # semantics of ZIP file name
         increment, psc1, timepoint = quarantine_filename_semantics(zip_file)
@@ -127,20 +256,68 @@ _BIDS_MAPPING = {
 }
 
 
-def dcm2nii(src, dst, filename, comment, bvec_bval=False):
+# limits the number of converters running concurrently across
+# worker processes, shared with each worker by _initialize_worker()
+_CONVERTER_SEMAPHORE = None
+
+
+def _initialize_worker(semaphore):
+    global _CONVERTER_SEMAPHORE
+    _CONVERTER_SEMAPHORE = semaphore
+
+
+def _converter_slot():
+    """Context manager that waits for a converter slot to be available.
+
+    """
+    if _CONVERTER_SEMAPHORE is None:
+        return contextlib.nullcontext()
+    return _CONVERTER_SEMAPHORE
+
+
+def _record_step(steps, step, start, **fields):
+    """Append timing and outcome of a conversion step to `steps`.
+
+    """
+    if steps is not None:
+        fields['step'] = step
+        fields['seconds'] = round(time.monotonic() - start, 3)
+        steps.append(fields)
+
+
+def _du(path):
+    """Size of files written by a converter into a directory.
+
+    Subdirectories are not walked: converters write into a single
+    directory.
+
+    """
+    with os.scandir(path) as it:
+        return sum(entry.stat().st_size for entry in it if entry.is_file())
+
+
+def dcm2nii(src, dst, filename, comment, bvec_bval=False, steps=None,
+            sidecar_only=False):
     status = 0
 
     logger.info('%s: running dcm2niix: %s', src, dst)
 
     dcm2niix = ['dcm2niix',
-                '-z', 'y', '-9'
+                '-z', 'y', '-9',
                 '-c', comment,
                 '-o', dst,
-                '-f', filename,
-                src]
-    completed = subprocess.run(dcm2niix,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE)
+                '-f', filename]
+    if sidecar_only:
+        # JSON sidecar only, imaging files will be created by dcm2nii
+        dcm2niix += ['-b', 'o']
+    dcm2niix.append(src)
+    with _converter_slot():
+        start = time.monotonic()
+        completed = subprocess.run(dcm2niix,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+    _record_step(steps, 'dcm2niix', start,
+                 returncode=completed.returncode, bytes=_du(dst))
     if completed.returncode:
         logger.error('%s: dcm2niix failed: %s',
                      src, completed.stdout)
@@ -158,7 +335,7 @@ def dcm2nii(src, dst, filename, comment, bvec_bval=False):
                 bval = True
             elif f.endswith('.json'):
                 json = os.path.join(dst, f)
-        if not bvec or not bval:
+        if sidecar_only or not bvec or not bval:
             # change "ConversionSoftware" in JSON sidecar
             if json:
                 with open(json, 'r') as f:
@@ -181,9 +358,14 @@ def dcm2nii(src, dst, filename, comment, bvec_bval=False):
                 dcm2nii = ['dcm2nii',
                            '-o', tempdir,
                            src]
-                completed = subprocess.run(dcm2nii,
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE)
+                with _converter_slot():
+                    start = time.monotonic()
+                    completed = subprocess.run(dcm2nii,
+                                               stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE)
+                _record_step(steps, 'dcm2nii', start,
+                             returncode=completed.returncode,
+                             bytes=_du(tempdir))
                 if completed.returncode:
                     logger.error('%s: dcm2nii failed: %s',
                                  src, completed.stdout)
@@ -215,6 +397,392 @@ def dcm2nii(src, dst, filename, comment, bvec_bval=False):
     return status
 
 
+class ConverterBackend(abc.ABC):
+    """Interface to a DICOM to NIfTI converter.
+
+    Attributes
+    ----------
+    name : str
+        Name of the converter, as recorded in session manifests.
+    version : str
+        Version of the converter, as recorded in session manifests, or
+        None if recorded by `converter_versions`.
+
+    """
+    name = None
+    version = None
+
+    @abc.abstractmethod
+    def convert(self, src, dst, filename, comment, bvec_bval=False,
+                steps=None, sidecar_only=False):
+        """Convert a DICOM series to NIfTI.
+
+        Parameters
+        ----------
+        src : str
+            Directory containing the DICOM files of the series.
+        dst : str
+            Directory to write NIfTI files into.
+        filename : str
+            Root of the name of NIfTI files.
+        comment : str
+            Comment to store in NIfTI files.
+        bvec_bval : bool
+            If True the series is a diffusion series.
+        steps : list, optional
+            List to append timing and outcome of conversion steps to.
+        sidecar_only : bool
+            If True the series lacks diffusion tags.
+
+        Returns
+        -------
+        int
+            0 on success.
+
+        """
+
+
+class Dcm2niixBackend(ConverterBackend):
+    """External dcm2niix process, falling back to dcm2nii for diffusion
+    series.
+
+    """
+    name = 'dcm2niix'
+
+    def convert(self, src, dst, filename, comment, bvec_bval=False,
+                steps=None, sidecar_only=False):
+        return dcm2nii(src, dst, filename, comment, bvec_bval, steps,
+                       sidecar_only)
+
+
+class Dicom2niftiBackend(ConverterBackend):
+    """In-process conversion with the dicom2nifti package.
+
+    Suitable for simple anatomical series only: diffusion series are not
+    supported. The JSON sidecar records the conversion software only, not
+    the acquisition parameters found in sidecars written by dcm2niix.
+
+    """
+    name = 'dicom2nifti'
+
+    def __init__(self):
+        import dicom2nifti
+        import nibabel
+        self._dicom2nifti = dicom2nifti
+        self._nibabel = nibabel
+        self.version = dicom2nifti.__version__
+
+    def convert(self, src, dst, filename, comment, bvec_bval=False,
+                steps=None, sidecar_only=False):
+        if bvec_bval:
+            raise ValueError('dicom2nifti cannot convert diffusion series')
+        logger.info('%s: running dicom2nifti: %s', src, dst)
+        status = 0
+        with _converter_slot():
+            start = time.monotonic()
+            try:
+                nii = self._dicom2nifti.dicom_series_to_nifti(
+                    src, None, reorient_nifti=False)['NII']
+                # same field as the comment of dcm2niix
+                nii.header['aux_file'] = comment[:24]
+                self._nibabel.save(nii, os.path.join(dst, filename + '.nii.gz'))
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error('%s: dicom2nifti failed: %s', src, str(e))
+                status = -1
+            else:
+                with open(os.path.join(dst, filename + '.json'), 'w') as f:
+                    json.dump({'ConversionSoftware': self.name,
+                               'ConversionSoftwareVersion': self.version},
+                              f, indent=4, sort_keys=True)
+        _record_step(steps, 'dicom2nifti', start,
+                     returncode=status, bytes=_du(dst))
+        return status
+
+
+_BACKENDS = {
+    backend.name: backend
+    for backend in (Dcm2niixBackend, Dicom2niftiBackend)
+}
+
+DEFAULT_BACKEND = Dcm2niixBackend.name
+
+
+@lru_cache(maxsize=None)
+def converter_backend(name):
+    """Instance of a converter backend.
+
+    Raises
+    ------
+    ImportError
+        If the package required by the backend is not available.
+
+    """
+    return _BACKENDS[name]()
+
+
+def _backend_name(backends, modality):
+    if backends:
+        return backends.get(modality, DEFAULT_BACKEND)
+    return DEFAULT_BACKEND
+
+
+def _backend_version(backends, modality):
+    return converter_backend(_backend_name(backends, modality)).version
+
+
+def _same_backend(previous, backends, modality):
+    """Check whether a modality of a manifest has been converted with the
+    backend currently chosen, in its current version.
+
+    """
+    return (previous.get('converter', DEFAULT_BACKEND) ==
+            _backend_name(backends, modality) and
+            previous.get('converter_version') ==
+            _backend_version(backends, modality))
+
+
+def _same_backends(manifest, backends):
+    """Check whether modalities of a manifest have been converted with
+    the backends currently chosen.
+
+    """
+    return all(_same_backend(previous, backends, modality)
+               for modality, previous in manifest.get('modalities', {}).items())
+
+
+def session_path(bids_path, psc2, timepoint):
+    return os.path.join(bids_path, 'sub-' + psc2, 'ses-' + timepoint)
+
+
+def read_skip_list(path):
+    """Read the list of datasets that must not be converted.
+
+    Parameters
+    ----------
+    path : str
+        JSON file mapping time points to lists of PSC1 codes.
+
+    Returns
+    -------
+    set
+        Set of (timepoint, psc1) pairs.
+
+    """
+    with open(path) as skip_file:
+        skip = json.load(skip_file)
+    return {(timepoint, psc1)
+            for timepoint, psc1_list in skip.items()
+            for psc1 in psc1_list}
+
+
+# written in each session directory after a successful conversion,
+# hidden files are ignored by BIDS tools
+# prefix of directories where a session is converted before its outputs
+# are moved into place
+_STAGING_PREFIX = '.cveda-'
+
+MANIFEST_NAME = '.cveda_conversion.json'
+
+
+@lru_cache(maxsize=None)
+def converter_versions():
+    """Versions of the DICOM to NIfTI converters.
+
+    Returns
+    -------
+    dict
+        Maps each converter to the first line of its usage message, which
+        includes the version, or None if the converter cannot be run.
+
+    """
+    versions = {}
+    for converter in ('dcm2niix', 'dcm2nii'):
+        try:
+            completed = subprocess.run([converter],
+                                       stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+        except OSError:
+            versions[converter] = None
+        else:
+            lines = completed.stdout.decode(errors='replace').splitlines()
+            versions[converter] = next((line.strip() for line in lines
+                                        if line.strip()), None)
+    return versions
+
+
+def read_manifest(out_ses_path):
+    try:
+        with open(os.path.join(out_ses_path, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(out_ses_path, zip_path, listing, modalities, outputs=None):
+    """Record the source and outputs of the conversion of a session.
+
+    Parameters
+    ----------
+    out_ses_path : str
+        BIDS session directory.
+    zip_path : str
+        ZIP file the session has been converted from.
+    listing : ZipListing
+        Listing of the ZIP file before conversion.
+    modalities : dict
+        Maps each modality to a dict with the digest of its DICOM files,
+        the list of its output files, relative to `out_ses_path`, and the
+        name and version of its converter backend.
+    outputs : list, optional
+        Output files relative to `out_ses_path`, by default the output
+        files of `modalities`.
+
+    """
+    if outputs is None:
+        outputs = (f for modality in modalities.values()
+                   for f in modality['outputs'])
+    outputs = sorted(outputs)
+    manifest = {
+        'source': {
+            'path': zip_path,
+            'size': listing.size,
+            'mtime': listing.mtime,
+            'digest': listing.digest,
+        },
+        'converters': converter_versions(),
+        'outputs': outputs,
+        'modalities': modalities,
+    }
+    path = os.path.join(out_ses_path, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _adopt_session(out_ses_path, zip_path, listing):
+    """Write a manifest for a session converted before manifests existed.
+
+    Outputs are not attributed to modalities, so the whole session will
+    be converted again if the ZIP file changes.
+
+    """
+    outputs = []
+    for root, dirs, files in os.walk(out_ses_path):
+        for filename in files:
+            path = os.path.relpath(os.path.join(root, filename), out_ses_path)
+            if path != MANIFEST_NAME:
+                outputs.append(path)
+    write_manifest(out_ses_path, zip_path, listing, {}, outputs)
+
+
+def is_up_to_date(out_ses_path, zip_path, listing, backends=None,
+                  adopt=False):
+    """Check whether a session has been converted from the current ZIP file
+    with the current converters.
+
+    Sessions converted before manifests existed are up to date if all
+    their files are more recent than the ZIP file. If `adopt` is True, a
+    manifest is written for these sessions, so that their files need not
+    be walked again.
+
+    Sessions with a staging directory left by an interrupted conversion
+    are never up to date.
+
+    """
+    if any(name.startswith(_STAGING_PREFIX)
+           for name in os.listdir(out_ses_path)):
+        return False
+    manifest = read_manifest(out_ses_path)
+    if manifest is None:
+        zip_timestamp = datetime.fromtimestamp(listing.mtime)
+        min_timestamp, max_timestamp = timestamps(out_ses_path)
+        # an empty session has no timestamps
+        if zip_timestamp < min_timestamp <= max_timestamp:
+            if adopt:
+                _adopt_session(out_ses_path, zip_path, listing)
+            return True
+        return False
+    source = manifest['source']
+    if (source['path'] != zip_path or source['size'] != listing.size or
+            manifest['converters'] != converter_versions() or
+            not _same_backends(manifest, backends)):
+        return False
+    return source['digest'] == listing.digest
+
+
+NEW = 'new'
+CHANGED = 'changed'
+SKIPPED = 'skipped'
+UP_TO_DATE = 'up-to-date'
+
+Session = namedtuple('Session', ('timepoint', 'psc1', 'zip_path', 'status',
+                                 'listing'))
+
+
+def plan_sessions(datasets, bids_path, skip, scanner, backends=None,
+                  adopt=False):
+    """Decide which datasets need to be converted.
+
+    Parameters
+    ----------
+    datasets : dict
+        Datasets as returned by `list_datasets`.
+    bids_path : str
+        Root of the BIDS tree.
+    skip : set
+        Set of (timepoint, psc1) pairs as returned by `read_skip_list`.
+    scanner : QuarantineScanner
+        Scanner used to list the datasets.
+    backends : dict, optional
+        Maps modalities to the name of their converter backend, if not
+        the default backend.
+    adopt : bool, optional
+        Write manifests for up-to-date sessions converted before manifests
+        existed, see `is_up_to_date`.
+
+    Returns
+    -------
+    list
+        List of `Session` sorted by time point and PSC1 code, with status
+        one of `NEW`, `CHANGED`, `SKIPPED` or `UP_TO_DATE`.
+
+    """
+    plan = []
+    for timepoint, timepoint_datasets in sorted(datasets.items()):
+        for psc1, (zip_path, increment, timestamp) in sorted(timepoint_datasets.items()):
+            if (timepoint, psc1) in skip:
+                status = SKIPPED
+            elif psc1 not in PSC2_FROM_PSC1:
+                logger.error('%s/%s: unknown PSC1 code', psc1, timepoint)
+                continue
+            else:
+                out_ses_path = session_path(bids_path, PSC2_FROM_PSC1[psc1],
+                                            timepoint)
+                listing = scanner.listing(zip_path)
+                if not os.path.isdir(out_ses_path):
+                    status = NEW
+                elif is_up_to_date(out_ses_path, zip_path, listing,
+                                   backends, adopt):
+                    status = UP_TO_DATE
+                else:
+                    status = CHANGED
+                plan.append(Session(timepoint, psc1, zip_path, status,
+                                    listing))
+                continue
+            plan.append(Session(timepoint, psc1, zip_path, status, None))
+    return plan
+
+
+def print_plan(plan):
+    for session in plan:
+        print('{}\t{}\t{}\t{}'.format(session.status, session.timepoint,
+                                       session.psc1, session.zip_path))
+    counts = Counter(session.status for session in plan)
+    print(', '.join('{}: {}'.format(status, counts[status])
+                    for status in (NEW, CHANGED, SKIPPED, UP_TO_DATE)))
+
+
 _DWI_MAPPING = {
     'dwi': None,
     'dwi_rev': 'rev',
@@ -222,152 +790,685 @@ _DWI_MAPPING = {
 }
 
 
-def deidentify(timepoint, psc1, zip_path, bids_path):
-    logger.info('%s/%s: deidentify', psc1, timepoint)
+def _diffusion_convention(src):
+    """Find diffusion tags in the first, middle and last DICOM files
+    of a series.
 
-    psc2 = PSC2_FROM_PSC1[psc1]
-    out_sub_path = os.path.join(bids_path, 'sub-' + psc2)
-    out_ses_path = os.path.join(out_sub_path, 'ses-' + timepoint)
+    """
+    paths = sorted(os.path.join(root, f)
+                   for root, dirs, files in os.walk(src) for f in files)
+    for path in paths[:1] + paths[len(paths) // 2:][:1] + paths[-1:]:
+        try:
+            convention = diffusion_convention(path, force=True)
+        except Exception:  # pylint: disable=broad-except
+            continue
+        if convention:
+            return convention
+    return None
 
-    # skip ZIP files that have already been processed
-    if os.path.isdir(out_ses_path):
-        zip_timestamp = datetime.fromtimestamp(os.path.getmtime(zip_path))
-        min_timestamp, max_timestamp = timestamps(out_ses_path)
-        if min_timestamp > zip_timestamp:
-            return
+
+def _convert_modality(tempdir, out_ses_path, modality,
+                      psc1, psc2, timepoint, steps=None,
+                      backend=DEFAULT_BACKEND):
+    src = os.path.join(tempdir, modality)
+    dst = os.path.join(out_ses_path, modality)
+
+    # name files as suggested in BIDS
+    if _BIDS_MAPPING[modality] == 'func':
+        filename = ('sub-' + psc2 + '_ses-' + timepoint +
+                    '_task-' + modality +
+                    '_bold')
+        bvec_bval = False
+    elif _BIDS_MAPPING[modality] == 'fmap':
+        filename = ('sub-' + psc2 + '_ses-' + timepoint)
+        bvec_bval = False
+    elif _BIDS_MAPPING[modality] == 'dwi':
+        acq = _DWI_MAPPING[modality]
+        if acq is None:
+            filename = ('sub-' + psc2 + '_ses-' + timepoint +
+                        '_dwi')
         else:
-            shutil.rmtree(out_ses_path)
-            os.makedirs(out_ses_path)
+            filename = ('sub-' + psc2 + '_ses-' + timepoint +
+                        '_acq-' + acq + '_dwi')
+        bvec_bval = True
+    else:
+        filename = ('sub-' + psc2 + '_ses-' + timepoint +
+                    '_' + modality)
+        bvec_bval = False
+
+    # dcm2niix derives bvec/bval files from diffusion tags, if they
+    # cannot be found dcm2nii will be needed anyway so skip dcm2niix
+    sidecar_only = False
+    if bvec_bval and backend == Dcm2niixBackend.name:
+        start = time.monotonic()
+        convention = _diffusion_convention(src)
+        sidecar_only = convention is None
+        converter = 'dcm2nii' if sidecar_only else 'dcm2niix'
+        logger.info('%s/%s: %s: %s diffusion tags, convert with %s',
+                    psc1, timepoint, modality, convention or 'no', converter)
+        _record_step(steps, 'precheck', start, modality=modality,
+                     convention=convention, converter=converter)
+
+    os.makedirs(dst)
+    converter_steps = [] if steps is not None else None
+    status = converter_backend(backend).convert(
+        src, dst, filename, psc2 + '/' + timepoint,
+        bvec_bval, converter_steps, sidecar_only)
+    if steps is not None:
+        for step in converter_steps:
+            step['modality'] = modality
+        steps.extend(converter_steps)
+    if status:
+        logger.error('%s/%s: cannot convert %s from DICOM to NIfTI: %d',
+                     psc1, timepoint, modality, status)
+        shutil.rmtree(dst)
+        return status
+
+    # rename some files for BIDS compliance
+    # remove useless extra files (such as ADC files)
+    start = time.monotonic()
+    for f in os.listdir(dst):
+        root, ext = os.path.splitext(f)
+        if ext == '.gz':
+            root, ext = os.path.splitext(root)
+            ext += '.gz'
+        if root.endswith('_c2'):  # MYSORE Philips Ingenia
+            root = root[:-len('_c2')]
+            os.rename(os.path.join(dst, f),
+                      os.path.join(dst, root + ext))
+        elif root.endswith('_dwi_ADC'):  # NIMHANS Siemens Skyra
+            logger.warning('%s/%s: DICOM conversion generates extra NIfTI file: %s',
+                           psc1, timepoint, f)
+            os.remove(os.path.join(dst, f))
+        elif root.endswith('_e2_ph'):  # Siemens
+            root = root[:-len('_e2_ph')]
+            os.rename(os.path.join(dst, f),
+                      os.path.join(dst, root + '_phasediff' + ext))
+        elif root.endswith('_e2_real'):  # Philips
+            root = root[:-len('_e2_real')]
+            os.rename(os.path.join(dst, f),
+                      os.path.join(dst, root + '_phasediff' + ext))
+        elif root.endswith('_e1a'):  # Philips
+            root = root[:-len('_e1a')]
+            os.rename(os.path.join(dst, f),
+                      os.path.join(dst, root + '_phasediff' + ext))
+        elif root.endswith('_e1'):  # Philips
+            root = root[:-len('_e1')]
+            os.rename(os.path.join(dst, f),
+                      os.path.join(dst, root + '_magnitude' + ext))
+        else:
+            root = root.replace('sub-' + psc2 + '_ses-' +
+                                timepoint + '_', '')
+            EXPECTED = {
+                'T1w',
+                'T2w',
+                'FLAIR',
+                'task-rest_bold',
+                'dwi', 'acq-ap_dwi',
+                'acq-rev_dwi',
+                'phasediff', 'magnitude',
+            }
+            if root not in EXPECTED:
+                logger.error('%s/%s: unexpected BIDS file: %s',
+                             psc1, timepoint, f)
+                status = -1
+    _record_step(steps, 'rename', start, modality=modality,
+                 bytes=_du(dst))
+
+    return status
+
+
+def _modality_members(listing):
+    """Group ZIP file members by top-level folder.
+
+    Returns
+    -------
+    dict
+        Maps each modality folder to the list of its `ZipMember` members.
+
+    """
+    members = {}
+    for member in listing.members:
+        modality, sep, rest = member.filename.partition('/')
+        if sep:
+            members.setdefault(modality, []).append(member)
+    return members
+
+
+def _modality_digest(modality, members):
+    """Digest of the name, CRC-32 and size of DICOM files of a modality.
+
+    """
+    return _members_digest(members, modality + '/')
+
+
+def _unchanged_modalities(out_ses_path, digests, backends=None):
+    """Modalities converted from the same DICOM files by the same converters.
+
+    Parameters
+    ----------
+    out_ses_path : str
+        BIDS session directory.
+    digests : dict
+        Maps each modality of the ZIP file to its digest.
+    backends : dict, optional
+        Maps modalities to the name of their converter backend.
+
+    Returns
+    -------
+    dict
+        Entries of the manifest of the previous conversion for modalities
+        that need not be converted again.
+
+    """
+    manifest = read_manifest(out_ses_path)
+    if (manifest is None or 'modalities' not in manifest or
+            manifest['converters'] != converter_versions()):
+        return {}
+    unchanged = {}
+    for modality, previous in manifest['modalities'].items():
+        if (digests.get(modality) == previous['digest'] and
+                _same_backend(previous, backends, modality) and
+                all(os.path.isfile(os.path.join(out_ses_path, f))
+                    for f in previous['outputs'])):
+            unchanged[modality] = previous
+    return unchanged
 
+
+def _clean_session(out_ses_path, keep):
+    """Remove files not in `keep` and empty directories from a session,
+    except staging directories.
+
+    """
+    for root, dirs, files in os.walk(out_ses_path, topdown=False):
+        relpath = os.path.relpath(root, out_ses_path)
+        if relpath.startswith(_STAGING_PREFIX):
+            continue
+        for filename in files:
+            path = os.path.join(root, filename)
+            if os.path.relpath(path, out_ses_path) not in keep:
+                os.remove(path)
+        if root != out_ses_path and not os.listdir(root):
+            os.rmdir(root)
+
+
+def _remove_session(out_ses_path):
+    """Remove a session and its subject directory if left empty.
+
+    """
+    if os.path.isdir(out_ses_path):
+        shutil.rmtree(out_ses_path)
+    out_sub_path = os.path.dirname(out_ses_path)
+    if os.path.isdir(out_sub_path) and not os.listdir(out_sub_path):
+        os.rmdir(out_sub_path)  # empty directory
+
+
+def _extract_modality(zip_path, modality, members, tempdir, psc1, timepoint,
+                      steps=None):
+    # each thread reads from its own ZipFile instance
+    start = time.monotonic()
     status = 0
-    prefix = 'cveda-mri-' + psc1
-    with tempfile.TemporaryDirectory(prefix=prefix) as tempdir:
-        # unpack ZIP file into temporary directory
+    try:
         with zipfile.ZipFile(zip_path) as zip_file:
-            try:
-                zip_file.extractall(tempdir)
-            except (zipfile.BadZipFile, OSError, EOFError, zlib.error) as e:
-                logger.error('%s/%s: corrupt ZIP file: %s',
-                             psc1, timepoint,  str(e))
-                return
-
-        # process each sequence found in ZIP file
-        for modality in os.listdir(tempdir):
-            src = os.path.join(tempdir, modality)
-            dst = os.path.join(out_ses_path, modality)
-
-            # name files as suggested in BIDS
-            if _BIDS_MAPPING[modality] == 'func':
-                filename = ('sub-' + psc2 + '_ses-' + timepoint +
-                            '_task-' + modality +
-                            '_bold')
-                bvec_bval = False
-            elif _BIDS_MAPPING[modality] == 'fmap':
-                filename = ('sub-' + psc2 + '_ses-' + timepoint)
-                bvec_bval = False
-            elif _BIDS_MAPPING[modality] == 'dwi':
-                acq = _DWI_MAPPING[modality]
-                if acq is None:
-                    filename = ('sub-' + psc2 + '_ses-' + timepoint +
-                                '_dwi')
-                else:
-                    filename = ('sub-' + psc2 + '_ses-' + timepoint +
-                                '_acq-' + acq + '_dwi')
-                bvec_bval = True
-            else:
-                filename = ('sub-' + psc2 + '_ses-' + timepoint +
-                            '_' + modality)
-                bvec_bval = False
-
-            os.makedirs(dst)
-            status = dcm2nii(src, dst,
-                             filename, psc2 + '/' + timepoint,
-                             bvec_bval)
-            if status:
-                logger.error('%s/%s: cannot convert %s from DICOM to NIfTI: %d',
-                             psc1, timepoint, modality, status)
-                shutil.rmtree(dst)
-                break
-
-            # rename some files for BIDS compliance
-            # remove useless extra files (such as ADC files)
-            for f in os.listdir(dst):
-                root, ext = os.path.splitext(f)
-                if ext == '.gz':
-                    root, ext = os.path.splitext(root)
-                    ext += '.gz'
-                if root.endswith('_c2'):  # MYSORE Philips Ingenia
-                    root = root[:-len('_c2')]
-                    os.rename(os.path.join(dst, f),
-                              os.path.join(dst, root + ext))
-                elif root.endswith('_dwi_ADC'):  # NIMHANS Siemens Skyra
-                    logger.warning('%s/%s: DICOM conversion generates extra NIfTI file: %s',
-                                   psc1, timepoint, f)
-                    os.remove(os.path.join(dst, f))
-                elif root.endswith('_e2_ph'):  # Siemens
-                    root = root[:-len('_e2_ph')]
-                    os.rename(os.path.join(dst, f),
-                              os.path.join(dst, root + '_phasediff' + ext))
-                elif root.endswith('_e2_real'):  # Philips
-                    root = root[:-len('_e2_real')]
-                    os.rename(os.path.join(dst, f),
-                              os.path.join(dst, root + '_phasediff' + ext))
-                elif root.endswith('_e1a'):  # Philips
-                    root = root[:-len('_e1a')]
-                    os.rename(os.path.join(dst, f),
-                              os.path.join(dst, root + '_phasediff' + ext))
-                elif root.endswith('_e1'):  # Philips
-                    root = root[:-len('_e1')]
-                    os.rename(os.path.join(dst, f),
-                              os.path.join(dst, root + '_magnitude' + ext))
-                else:
-                    root = root.replace('sub-' + psc2 + '_ses-' +
-                                        timepoint + '_', '')
-                    EXPECTED = {
-                        'T1w',
-                        'T2w',
-                        'FLAIR',
-                        'task-rest_bold',
-                        'dwi', 'acq-ap_dwi',
-                        'acq-rev_dwi',
-                        'phasediff', 'magnitude',
-                    }
-                    if root not in EXPECTED:
-                        logger.error('%s/%s: unexpected BIDS file: %s',
-                                     psc1, timepoint, f)
-                        status = -1
+            zip_file.extractall(tempdir, [m.filename for m in members])
+    except (zipfile.BadZipFile, OSError, EOFError, zlib.error) as e:
+        logger.error('%s/%s: corrupt ZIP file: %s',
+                     psc1, timepoint, str(e))
+        status = -1
+    _record_step(steps, 'extract', start, modality=modality, status=status,
+                 bytes=sum(m.file_size for m in members))
+    return status
+
+
+def _process_modality(zip_path, members, tempdir, out_ses_path, modality,
+                      psc1, psc2, timepoint, steps=None,
+                      backend=DEFAULT_BACKEND):
+    status = _extract_modality(zip_path, modality, members, tempdir,
+                               psc1, timepoint, steps)
+    if not status:
+        status = _convert_modality(tempdir, out_ses_path, modality,
+                                   psc1, psc2, timepoint, steps, backend)
+    src = os.path.join(tempdir, modality)
+    if os.path.isdir(src):
+        shutil.rmtree(src)
+    return status
+
+
+def _convert_modalities(zip_path, members, modalities, staging,
+                        psc1, psc2, timepoint, modality_jobs=1, scratch=None,
+                        steps=None, backends=None):
+    """Extract and convert modalities of a ZIP file into a staging directory.
+
+    Returns
+    -------
+    int
+        0 on success.
+
+    """
+    status = 0
+    prefix = 'cveda-mri-' + psc1
+    with tempfile.TemporaryDirectory(prefix=prefix, dir=scratch) as tempdir:
+        # process each sequence found in ZIP file, unpacking one
+        # sequence at a time into the temporary directory
+        if modality_jobs > 1:
+            with ThreadPoolExecutor(max_workers=modality_jobs) as executor:
+                futures = [executor.submit(_process_modality,
+                                           zip_path, members[modality],
+                                           tempdir, staging, modality,
+                                           psc1, psc2, timepoint, steps,
+                                           _backend_name(backends, modality))
+                           for modality in modalities]
+                try:
+                    for future in as_completed(futures):
+                        status = future.result()
+                        if status:
+                            break
+                finally:
+                    # on first failure, do not start modalities still queued
+                    for future in futures:
+                        future.cancel()
+        else:
+            # unpack next sequence while converting current sequence
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                futures = {}
+                if modalities:
+                    futures[modalities[0]] = executor.submit(
+                        _extract_modality, zip_path, modalities[0],
+                        members[modalities[0]], tempdir, psc1, timepoint,
+                        steps)
+                for i, modality in enumerate(modalities):
+                    status = futures.pop(modality).result()
+                    if status:
+                        break
+                    if i + 1 < len(modalities):
+                        following = modalities[i + 1]
+                        futures[following] = executor.submit(
+                            _extract_modality, zip_path, following,
+                            members[following], tempdir, psc1, timepoint,
+                            steps)
+                    status = _convert_modality(tempdir, staging, modality,
+                                               psc1, psc2, timepoint, steps,
+                                               _backend_name(backends,
+                                                             modality))
+                    shutil.rmtree(os.path.join(tempdir, modality))
+                    if status:
+                        break
+
+    return status
 
+
+def deidentify(timepoint, psc1, zip_path, bids_path, modality_jobs=1,
+               scratch=None, listing=None, steps=None, backends=None):
+    logger.info('%s/%s: deidentify', psc1, timepoint)
+
+    psc2 = PSC2_FROM_PSC1[psc1]
+    out_ses_path = session_path(bids_path, psc2, timepoint)
+
+    # reuse the listing from the planning stage unless the ZIP file
+    # has changed since
+    try:
+        if listing is None or not _is_current(listing, zip_path):
+            listing = read_zip_listing(zip_path)
+    except (zipfile.BadZipFile, OSError) as e:
+        logger.error('%s/%s: corrupt ZIP file: %s',
+                     psc1, timepoint, str(e))
+        return
+    members = _modality_members(listing)
+    start = time.monotonic()
+
+    os.makedirs(out_ses_path, exist_ok=True)
+    # remove staging directories left by interrupted conversions
+    for name in os.listdir(out_ses_path):
+        if name.startswith(_STAGING_PREFIX):
+            shutil.rmtree(os.path.join(out_ses_path, name))
+    # until the new manifest is written, the staging directory marks
+    # the session as incomplete, see `is_up_to_date`
+    staging = tempfile.mkdtemp(prefix=_STAGING_PREFIX, dir=out_ses_path)
+
+    # keep outputs of modalities that have not changed since the
+    # previous conversion, replace everything else
+    digests = {modality: _modality_digest(modality, modality_members)
+               for modality, modality_members in members.items()}
+    unchanged = _unchanged_modalities(out_ses_path, digests, backends)
+    if unchanged:
+        logger.info('%s/%s: keep unchanged modalities: %s',
+                    psc1, timepoint, ', '.join(sorted(unchanged)))
+    _clean_session(out_ses_path, {f for modality in unchanged.values()
+                                  for f in modality['outputs']})
+
+    modalities = sorted(m for m in members if m not in unchanged)
+    _record_step(steps, 'plan', start,
+                 converted=modalities, kept=sorted(unchanged))
+    try:
+        status = _convert_modalities(zip_path, members, modalities, staging,
+                                     psc1, psc2, timepoint, modality_jobs,
+                                     scratch, steps, backends)
+        if not status:
+            # move files to directories named as suggested in BIDS
+            converted = dict(unchanged)
+            for modality in modalities:
+                src = os.path.join(staging, modality)
+                dst = os.path.join(out_ses_path, _BIDS_MAPPING[modality])
+                os.makedirs(dst, exist_ok=True)
+                outputs = []
+                for f in sorted(os.listdir(src)):
+                    os.replace(os.path.join(src, f), os.path.join(dst, f))
+                    outputs.append(_BIDS_MAPPING[modality] + '/' + f)
+                converted[modality] = {
+                    'digest': digests[modality],
+                    'outputs': outputs,
+                    'converter': _backend_name(backends, modality),
+                }
+                version = _backend_version(backends, modality)
+                if version:
+                    converted[modality]['converter_version'] = version
+            write_manifest(out_ses_path, zip_path, listing, converted)
+            shutil.rmtree(staging)
+    except BaseException:
+        _remove_session(out_ses_path)
+        raise
     if status:
-        shutil.rmtree(out_ses_path)
-        if not os.listdir(out_sub_path):  # empty directory
-            os.rmdir(out_sub_path)
-    else:
-        # rename some directories for BIDS compliance
-        for modality in os.listdir(out_ses_path):
-            src = os.path.join(out_ses_path, modality)
-            dst = os.path.join(out_ses_path, _BIDS_MAPPING[modality])
-            if src != dst:
-                if os.path.isdir(dst):
-                    for f in os.listdir(src):
-                        os.rename(os.path.join(src, f),
-                                  os.path.join(dst, f))
-                    os.rmdir(src)
-                else:
-                    os.rename(src, dst)
+        _remove_session(out_ses_path)
 
     return status
 
 
-def main():
-    datasets = list_datasets(QUARANTINE_PATH)
+class SessionError(Exception):
+    """Conversion of a session raised an exception.
+
+    Attributes
+    ----------
+    steps : list
+        Records of the steps completed before the exception, followed by
+        a failure record of the session.
+
+    """
+
+    def __init__(self, message, steps):
+        super().__init__(message, steps)
+        self.steps = steps
+
+    def __str__(self):
+        return self.args[0]
+
+
+def _deidentify_session(session, bids_path, modality_jobs, scratch,
+                        backends=None):
+    """Convert a session in a worker process.
+
+    Returns
+    -------
+    tuple
+        Status of the conversion and list of step records.
+
+    Raises
+    ------
+    SessionError
+        If the conversion raises an exception.
+
+    """
+    steps = []
+    start = time.monotonic()
+    try:
+        status = deidentify(session.timepoint, session.psc1, session.zip_path,
+                            bids_path, modality_jobs, scratch, session.listing,
+                            steps, backends)
+    except Exception as e:
+        _record_step(steps, 'session', start, status=None, error=repr(e),
+                     scratch=scratch, bytes=session.listing.size)
+        raise SessionError(str(e), steps) from e
+    _record_step(steps, 'session', start, status=status, scratch=scratch,
+                 bytes=session.listing.size)
+    return status, steps
+
+
+def scratch_paths(paths=()):
+    """Writable scratch directories, followed by the default temporary
+    directory.
+
+    RAM-backed file systems such as /dev/shm are faster but compete with
+    converters for memory: they are used only if requested.
+
+    """
+    result = []
+    for path in list(paths) + [tempfile.gettempdir()]:
+        if (path not in result and os.path.isdir(path) and
+                os.access(path, os.W_OK)):
+            result.append(path)
+    return result
+
+
+def required_space(listing, modality_jobs=1):
+    """Scratch space needed to convert a ZIP file.
+
+    Modalities are extracted one at a time, while the next modality is
+    being extracted or while other modalities are being converted.
+
+    Returns
+    -------
+    int
+        Uncompressed size of the largest modalities that can be extracted
+        at the same time.
+
+    """
+    sizes = {modality: sum(member.file_size for member in members)
+             for modality, members in _modality_members(listing).items()}
+    largest = sorted(sizes.values(), reverse=True)
+    return sum(largest[:max(2, modality_jobs)])
+
 
-    for timepoint, timepoint_datasets in datasets.items():
-        for psc1, (zip_path, increment, timestamp) in timepoint_datasets.items():
-            with open(SKIP_PATH) as skip_file:
-                skip = json.load(skip_file)
-                if timepoint in skip and psc1 in skip[timepoint]:
+class ScratchSpace:
+    """Reserve space in scratch directories for sessions being converted.
+
+    Attributes
+    ----------
+    paths : list
+        Scratch directories by order of preference.
+    reserved : dict
+        Maps each scratch directory to the space reserved by sessions
+        being converted.
+
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.reserved = dict.fromkeys(paths, 0)
+
+    def reserve(self, size):
+        """Reserve space in the first scratch directory where it fits.
+
+        Returns
+        -------
+        str
+            Scratch directory, or None if the session does not fit.
+
+        """
+        for path in self.paths:
+            if shutil.disk_usage(path).free - self.reserved[path] >= size:
+                self.reserved[path] += size
+                return path
+        return None
+
+    def release(self, path, size):
+        self.reserved[path] -= size
+
+
+def _not_enough_space(session, size):
+    logger.error('%s/%s: not enough scratch space: %d bytes required',
+                 session.psc1, session.timepoint, size)
+
+
+def _write_report(report, session, steps):
+    """Append step records of a session to a JSON lines report."""
+    if report:
+        psc2 = PSC2_FROM_PSC1[session.psc1]
+        for step in steps:
+            step.update(timepoint=session.timepoint, psc2=psc2)
+            report.write(json.dumps(step, sort_keys=True))
+            report.write('\n')
+        report.flush()
+
+
+def convert_sessions(sessions, bids_path, scratch,
+                     jobs=1, modality_jobs=1, converters=None, report=None,
+                     backends=None):
+    """Convert sessions, starting each session once enough scratch space
+    is available.
+
+    Parameters
+    ----------
+    sessions : list
+        List of `Session`.
+    bids_path : str
+        Root of the BIDS tree.
+    scratch : ScratchSpace
+        Scratch directories to extract ZIP files into.
+    jobs : int
+        Number of sessions to convert concurrently. A single session at a
+        time is converted in this process and the first failure aborts.
+    modality_jobs : int
+        Number of modalities to convert concurrently within a session.
+    converters : int
+        Maximum number of converter processes running at the same time.
+    report : file object, optional
+        Text file to write JSON lines with timing and outcome of each
+        conversion step into.
+    backends : dict, optional
+        Maps modalities to the name of their converter backend, if not
+        the default backend.
+
+    """
+    semaphore = multiprocessing.BoundedSemaphore(converters or os.cpu_count())
+    pending = [(session, required_space(session.listing, modality_jobs))
+               for session in sessions]
+
+    if jobs <= 1:
+        # convert in this process, letting exceptions through
+        _initialize_worker(semaphore)
+        for session, size in pending:
+            path = scratch.reserve(size)
+            if path is None:
+                _not_enough_space(session, size)
+                continue
+            try:
+                status, steps = _deidentify_session(session, bids_path,
+                                                    modality_jobs, path,
+                                                    backends)
+            except SessionError as e:
+                _write_report(report, session, e.steps)
+                raise
+            finally:
+                scratch.release(path, size)
+            _write_report(report, session, steps)
+        return
+
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs,
+                             initializer=_initialize_worker,
+                             initargs=(semaphore,)) as executor:
+        while pending or running:
+            # start any pending session that fits, not only the first one
+            for session, size in list(pending):
+                if len(running) >= jobs:
+                    break
+                path = scratch.reserve(size)
+                if path is None:
+                    if not running:
+                        # does not fit even with all scratch space free
+                        _not_enough_space(session, size)
+                        pending.remove((session, size))
                     continue
-            deidentify(timepoint, psc1, zip_path, BIDS_PATH)
+                pending.remove((session, size))
+                future = executor.submit(_deidentify_session, session,
+                                         bids_path, modality_jobs, path,
+                                         backends)
+                running[future] = (session, path, size)
+            if running:
+                done, not_done = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    session, path, size = running.pop(future)
+                    scratch.release(path, size)
+                    try:
+                        status, steps = future.result()
+                    except SessionError as e:
+                        logger.error('%s/%s: conversion failed: %s',
+                                     session.psc1, session.timepoint, str(e))
+                        steps = e.steps
+                    _write_report(report, session, steps)
+
+
+def _parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Convert MRI uploads from quarantine to BIDS.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of sessions to convert concurrently')
+    parser.add_argument('--modality-jobs', type=int, default=1,
+                        help='number of modalities to convert concurrently '
+                             'within a session')
+    parser.add_argument('--converters', type=int, default=os.cpu_count(),
+                        help='maximum number of dcm2niix/dcm2nii processes '
+                             'running at the same time')
+    parser.add_argument('--scratch', action='append',
+                        help='directory to extract ZIP files into before '
+                             'the default temporary directory, such as '
+                             '/dev/shm, may be repeated')
+    parser.add_argument('--listing-cache',
+                        help='JSON file to cache listings of ZIP files '
+                             'between runs')
+    parser.add_argument('--report',
+                        help='append timing and outcome of conversion steps '
+                             'to this JSON lines file')
+    parser.add_argument('--backend', action='append', default=[],
+                        metavar='MODALITY=BACKEND',
+                        help='convert a modality with another backend, '
+                             'one of: {} (default: {})'.format(
+                                 ', '.join(sorted(_BACKENDS)),
+                                 DEFAULT_BACKEND))
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='print the work plan and exit')
+    args = parser.parse_args()
+
+    backends = {}
+    for choice in args.backend:
+        modality, sep, name = choice.partition('=')
+        if not sep or modality not in _BIDS_MAPPING or name not in _BACKENDS:
+            parser.error('invalid backend choice: ' + choice)
+        if name != DEFAULT_BACKEND and _BIDS_MAPPING[modality] != 'anat':
+            parser.error('{} can convert anatomical series only: {}'
+                         .format(name, choice))
+        try:
+            converter_backend(name)
+        except ImportError as e:
+            parser.error('{} is not available: {}'.format(name, str(e)))
+        backends[modality] = name
+    args.backend = backends
+
+    return args
+
+
+def main():
+    args = _parse_arguments()
+
+    scanner = QuarantineScanner(args.listing_cache)
+    datasets = list_datasets(QUARANTINE_PATH, scanner)
+    skip = read_skip_list(SKIP_PATH)
+    plan = plan_sessions(datasets, BIDS_PATH, skip, scanner, args.backend,
+                         adopt=not args.dry_run)
+    scanner.save()
+
+    if args.dry_run:
+        print_plan(plan)
+        return
+
+    sessions = [session for session in plan
+                if session.status in {NEW, CHANGED}]
+
+    scratch = ScratchSpace(scratch_paths(args.scratch or ()))
+    with (open(args.report, 'a') if args.report
+          else contextlib.nullcontext()) as report:
+        convert_sessions(sessions, BIDS_PATH, scratch,
+                         args.jobs, args.modality_jobs, args.converters,
+                         report, args.backend)
 
 
 if __name__ == "__main__":
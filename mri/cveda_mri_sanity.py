@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+"""Check all MRI uploads in the quarantine directory.
+
+Results are written as JSON lines, one line per ZIP file, to the standard
+output or appended to a file. A run can be resumed from the last file
+recorded in the output file. Results can also be cached, so that unchanged
+files are not checked again in subsequent runs.
+
+"""
+
+import os
+import sys
+import json
+import argparse
+from cveda_databank.sanity import check_quarantine
+from cveda_databank.sanity import VerdictCache
+import logging
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+QUARANTINE_PATH = '/cveda/databank/RAW/QUARANTINE'
+
+SEQUENCES = ('T1w', 'rest', 'B0_map', 'dwi', 'dwi_rev', 'FLAIR', 'T2w')
+
+
+def last_checked(path):
+    """Find the last file recorded in a JSON lines output file.
+
+    Parameters
+    ----------
+    path : str
+        JSON lines output file of a previous run.
+
+    Returns
+    -------
+    str
+        Name of the last ZIP file checked, None if there is none.
+
+    """
+    filename = None
+    if os.path.isfile(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    filename = json.loads(line)['filename']
+                except (ValueError, KeyError):
+                    # typically the last line of an interrupted run
+                    logger.warning('%s: skip invalid line', path)
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', nargs='?', default=QUARANTINE_PATH,
+                        help='quarantine directory (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of ZIP files checked concurrently')
+    parser.add_argument('-o', '--output',
+                        help='append results to this file instead of standard output')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip files up to the last file recorded in the output file')
+    parser.add_argument('--sequences', default=','.join(SEQUENCES),
+                        help='comma-separated list of expected sequence folders')
+    parser.add_argument('--integrity', action='store_true',
+                        help='also verify the CRC-32 of each file in ZIP files')
+    parser.add_argument('--cache',
+                        help='skip unchanged files already checked, as recorded in this file')
+    args = parser.parse_args()
+
+    resume_after = None
+    if args.resume:
+        if not args.output:
+            parser.error('--resume requires --output')
+        resume_after = last_checked(args.output)
+        if resume_after:
+            logger.info('resume after: %s', resume_after)
+
+    expected = {sequence: 'Good' for sequence in args.sequences.split(',')}
+
+    cache = VerdictCache(args.cache) if args.cache else None
+
+    output = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        for record in check_quarantine(args.path, expected,
+                                       workers=args.jobs,
+                                       resume_after=resume_after,
+                                       cache=cache,
+                                       integrity=args.integrity):
+            output.write(json.dumps(record, default=str) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -58,6 +58,7 @@ setup(
         'follow_up/cveda_follow_up_planning_2018.py',
         'freeze/cveda_freeze_psytools.py',
         'mri/cveda_mri_deidentify.py',
+        'mri/cveda_mri_sanity.py',
         'psc/cveda_generate_psc1.py',
         'psc/cveda_generate_psc2.py',
         'psytools/cveda_psytools_download.py',
@@ -81,5 +82,9 @@ setup(
         'pydicom',
         'jellyfish',
         'openpyxl',
+        # concurrent.futures backport
+        'futures; python_version < "3"',
+        # os.scandir backport
+        'scandir; python_version < "3"',
     ],
 )
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import datetime
+import io
+
+import pandas
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+from cveda_databank.dicom_utils import (_datetime_from_dt, _date_from_da,
+                                        _time_from_tm, read_metadata,
+                                        read_metadata_many,
+                                        PATIENT_ID_TAGS_FROM_CENTER)
+
+
+def _dicom_bytes(**tags):
+    """DICOM file with mandatory tags of read_metadata() and `tags`."""
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.SOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+    ds.SOPInstanceUID = '1.2.3'
+    ds.SeriesInstanceUID = '1.2.4'
+    ds.SeriesNumber = 1
+    ds.SeriesDescription = 'MPRAGE'
+    ds.ImageType = ['ORIGINAL', 'PRIMARY']
+    for keyword, value in tags.items():
+        setattr(ds, keyword, value)
+    f = io.BytesIO()
+    try:
+        ds.save_as(f, enforce_file_format=True)  # pydicom >= 3.0
+    except TypeError:
+        ds.is_little_endian = True
+        ds.is_implicit_VR = False
+        ds.save_as(f, write_like_original=False)
+    return f.getvalue()
+
+
+def _patient_id(center, **tags):
+    metadata = read_metadata(io.BytesIO(_dicom_bytes(**tags)), center=center)
+    return metadata.get('PatientID')
+
+
+# a fractional part of zero bypasses the fast paths
+@pytest.mark.parametrize('dt', [
+    '20190102030405',
+    '19991231235959',
+    '20200229120000',
+    '00010101000000',
+])
+def test_datetime_from_dt_fast_path(dt):
+    fast = _datetime_from_dt(dt)
+    assert fast == _datetime_from_dt(dt + '.0')
+    assert fast == datetime.datetime(int(dt[0:4]), int(dt[4:6]), int(dt[6:8]),
+                                     int(dt[8:10]), int(dt[10:12]),
+                                     int(dt[12:14]))
+
+
+@pytest.mark.parametrize('dt', [
+    '20191302030405',
+    '20190230030405',
+    '20190102250405',
+])
+def test_datetime_from_dt_fast_path_invalid(dt):
+    with pytest.raises(ValueError):
+        _datetime_from_dt(dt)
+    with pytest.raises(ValueError):
+        _datetime_from_dt(dt + '.0')
+
+
+def test_datetime_from_dt_slow_path():
+    assert _datetime_from_dt('2019') == datetime.datetime(2019, 1, 1)
+    assert (_datetime_from_dt('20190102030405.5') ==
+            datetime.datetime(2019, 1, 2, 3, 4, 5, 500000))
+    aware = _datetime_from_dt('20190102030405+0530')
+    assert aware.utcoffset() == datetime.timedelta(hours=5, minutes=30)
+    assert _datetime_from_dt('not a date') is None
+
+
+@pytest.mark.parametrize('tm', [
+    '030405',
+    '235959',
+    '000000',
+])
+def test_time_from_tm_fast_path(tm):
+    fast = _time_from_tm(tm)
+    assert fast == _time_from_tm(tm + '.0')
+    assert fast == datetime.time(int(tm[0:2]), int(tm[2:4]), int(tm[4:6]))
+
+
+@pytest.mark.parametrize('tm', [
+    '250405',
+    '036005',
+])
+def test_time_from_tm_fast_path_invalid(tm):
+    with pytest.raises(ValueError):
+        _time_from_tm(tm)
+    with pytest.raises(ValueError):
+        _time_from_tm(tm + '.0')
+
+
+def test_time_from_tm_slow_path():
+    assert _time_from_tm('03') == datetime.time(3)
+    assert _time_from_tm('0304') == datetime.time(3, 4)
+    assert _time_from_tm('030405.25') == datetime.time(3, 4, 5, 250000)
+    assert _time_from_tm('not a time') is None
+
+
+def test_date_from_da():
+    assert _date_from_da('20190102') == datetime.date(2019, 1, 2)
+    assert _date_from_da('2019.01.02') == datetime.date(2019, 1, 2)
+    assert _date_from_da('2019') is None
+
+
+ALL_IDS = {
+    'CommentsOnThePerformedProcedureStep': 'performed procedure step',
+    'PatientComments': 'patient comments',
+    'StudyComments': 'study comments',
+    'PatientID': 'patient ID',
+    'PatientName': 'patient name',
+}
+
+
+def test_patient_id_mysore():
+    assert _patient_id('MYSORE', **ALL_IDS) == 'performed procedure step'
+    # PatientID is not used by this centre
+    assert _patient_id('MYSORE', PatientID='patient ID') is None
+
+
+def test_patient_id_nimhans():
+    assert _patient_id('NIMHANS', **ALL_IDS) == 'patient comments'
+    assert _patient_id('NIMHANS', StudyComments='study comments',
+                       PatientID='patient ID') == 'study comments'
+    assert _patient_id('NIMHANS', PatientID='patient ID') == 'patient ID'
+    assert _patient_id('NIMHANS',
+                       CommentsOnThePerformedProcedureStep='step') is None
+
+
+@pytest.mark.parametrize('center', ['NIMHANS_pilot', 'PGIMER'])
+def test_patient_id_patient_id(center):
+    assert _patient_id(center, **ALL_IDS) == 'patient ID'
+    assert _patient_id(center, PatientComments='patient comments') is None
+
+
+def test_patient_id_kolkata():
+    patient_id = _patient_id('KOLKATA', **ALL_IDS)
+    assert patient_id == 'patient name'
+    assert type(patient_id) is str
+    assert _patient_id('KOLKATA', PatientID='patient ID') is None
+
+
+@pytest.mark.parametrize('center', [None, 'UNKNOWN'])
+def test_patient_id_any_center(center):
+    assert _patient_id(center, **ALL_IDS) == 'performed procedure step'
+    tags = dict(ALL_IDS)
+    del tags['CommentsOnThePerformedProcedureStep']
+    assert _patient_id(center, **tags) == 'patient comments'
+    del tags['PatientComments']
+    assert _patient_id(center, **tags) == 'study comments'
+    del tags['StudyComments']
+    assert _patient_id(center, **tags) == 'patient ID'
+    del tags['PatientID']
+    assert _patient_id(center, **tags) == 'patient name'
+    assert _patient_id(center) is None
+
+
+def test_patient_id_centers():
+    # each centre is covered above
+    assert sorted(PATIENT_ID_TAGS_FROM_CENTER) == [
+        'KOLKATA', 'MYSORE', 'NIMHANS', 'NIMHANS_pilot', 'PGIMER']
+
+
+@pytest.fixture
+def dicom_paths(tmpdir):
+    paths = []
+    for i in range(8):
+        path = tmpdir.join('{0:04d}.dcm'.format(i))
+        path.write_binary(_dicom_bytes(SOPInstanceUID='1.2.3.{0}'.format(i),
+                                       SeriesNumber=i,
+                                       PatientID='00000000000{0}'.format(i),
+                                       AcquisitionDate='20190102'))
+        paths.append(str(path))
+    unreadable = tmpdir.join('unreadable.dcm')
+    unreadable.write_binary(b'not a DICOM file')
+    paths.insert(3, str(unreadable))
+    return paths
+
+
+def test_read_metadata_many(dicom_paths):
+    frame = read_metadata_many(dicom_paths)
+    assert list(frame.columns) == [
+        'SOPInstanceUID',
+        'SeriesInstanceUID',
+        'SeriesNumber',
+        'SeriesDescription',
+        'ImageType',
+        'AcquisitionDate',
+        'AcquisitionTime',
+        'StationName',
+        'Manufacturer',
+        'ManufacturerModelName',
+        'DeviceSerialNumber',
+        'SoftwareVersions',
+        'PatientID',
+        'Error',
+    ]
+    assert frame.index.name == 'Path'
+    assert list(frame.index) == dicom_paths
+
+    unreadable = dicom_paths[3]
+    assert frame.loc[unreadable, 'Error']
+    assert frame.loc[unreadable, ['SOPInstanceUID', 'PatientID']].isnull().all()
+
+    readable = frame.drop(unreadable)
+    assert readable['Error'].isnull().all()
+    assert list(readable['SeriesNumber']) == list(range(8))
+    assert readable.loc[dicom_paths[0], 'PatientID'] == '000000000000'
+    assert (readable['AcquisitionDate'] ==
+            datetime.date(2019, 1, 2)).all()
+    for image_type in readable['ImageType']:
+        assert image_type == ('ORIGINAL', 'PRIMARY')
+    # tuples can be grouped
+    assert readable.groupby('ImageType').size().tolist() == [8]
+
+
+def test_read_metadata_many_workers(dicom_paths):
+    pandas.testing.assert_frame_equal(read_metadata_many(dicom_paths,
+                                                         workers=2),
+                                      read_metadata_many(dicom_paths))
+
+
+def test_read_metadata_many_empty():
+    frame = read_metadata_many([])
+    assert len(frame) == 0
+    assert 'Error' in frame.columns
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import os
+import sys
+import time
+from zipfile import ZipFile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'mri'))
+import cveda_mri_deidentify as deidentify  # noqa: E402
+
+PSC1 = '000000000001'
+PSC2 = 'ABCDEFGHIJKL'
+CONVERTERS = {'dcm2niix': 'dcm2niix v1.0', 'dcm2nii': 'dcm2nii v1.0'}
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    monkeypatch.setattr(deidentify, 'PSC2_FROM_PSC1', {PSC1: PSC2})
+    # do not run dcm2niix and dcm2nii
+    monkeypatch.setattr(deidentify, 'converter_versions',
+                        lambda: dict(CONVERTERS))
+
+
+@pytest.fixture
+def quarantine(tmpdir):
+    return str(tmpdir.mkdir('quarantine'))
+
+
+@pytest.fixture
+def bids(tmpdir):
+    return str(tmpdir.mkdir('bids'))
+
+
+def _make_zip(path, content=b'content', age=None, dwi_content=None):
+    with ZipFile(path, 'w') as z:
+        z.writestr('T1w/0001.dcm', content)
+        z.writestr('dwi/0001.dcm', dwi_content or content)
+    if age is not None:
+        timestamp = time.time() - age
+        os.utime(path, (timestamp, timestamp))
+    return path
+
+
+class StubBackend(deidentify.ConverterBackend):
+    """Write a NIfTI file per series, or fail for some modalities."""
+    name = deidentify.DEFAULT_BACKEND
+
+    def __init__(self):
+        self.converted = []
+        self.raise_on = set()
+        self.fail_on = set()
+
+    def convert(self, src, dst, filename, comment, bvec_bval=False,
+                steps=None, sidecar_only=False):
+        modality = os.path.basename(dst)
+        self.converted.append(modality)
+        if modality in self.raise_on:
+            raise RuntimeError('cannot convert ' + modality)
+        if modality in self.fail_on:
+            return 1
+        with open(os.path.join(dst, filename + '.nii.gz'), 'w') as f:
+            f.write(comment)
+        return 0
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = StubBackend()
+    monkeypatch.setattr(deidentify, 'converter_backend', lambda name: backend)
+    monkeypatch.setattr(deidentify, '_diffusion_convention', lambda src: None)
+    return backend
+
+
+def _plan(quarantine, bids, skip=(), backends=None, adopt=False):
+    scanner = deidentify.QuarantineScanner()
+    datasets = deidentify.list_datasets(quarantine, scanner)
+    return deidentify.plan_sessions(datasets, bids, set(skip), scanner,
+                                    backends, adopt)
+
+
+def _convert(bids, zip_path, converter='dcm2niix'):
+    """Pretend a session has been converted."""
+    listing = deidentify.read_zip_listing(zip_path)
+    out_ses_path = deidentify.session_path(bids, PSC2, 'BL')
+    os.makedirs(os.path.join(out_ses_path, 'anat'))
+    output = 'anat/sub-{0}_ses-BL_T1w.nii.gz'.format(PSC2)
+    open(os.path.join(out_ses_path, output), 'w').close()
+    members = deidentify._modality_members(listing)['T1w']
+    modalities = {
+        'T1w': {
+            'digest': deidentify._modality_digest('T1w', members),
+            'outputs': [output],
+            'converter': converter,
+        },
+    }
+    deidentify.write_manifest(out_ses_path, zip_path, listing, modalities)
+    return out_ses_path
+
+
+def test_list_datasets(quarantine):
+    _make_zip(os.path.join(quarantine, '1_data_{0}aaaaaa.zip'.format(PSC1)),
+              age=100)
+    latest = _make_zip(os.path.join(quarantine,
+                                    '2_data_{0}bbbbbb.zip'.format(PSC1)))
+    _make_zip(os.path.join(quarantine,
+                           '3_data_{0}FU1cccccc.zip'.format(PSC1)))
+    datasets = deidentify.list_datasets(quarantine)
+    assert sorted(datasets) == ['BL', 'FU1']
+    assert datasets['BL'][PSC1][0] == latest
+
+
+def test_plan_new(quarantine, bids):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    _make_zip(os.path.join(quarantine, '1_data_999999999999aaaaaa.zip'))
+    plan = _plan(quarantine, bids)
+    assert [(s.timepoint, s.psc1, s.zip_path, s.status) for s in plan] == [
+        ('BL', PSC1, zip_path, deidentify.NEW),
+    ]
+    assert plan[0].listing == deidentify.read_zip_listing(zip_path)
+
+
+def test_plan_skipped(quarantine, bids):
+    _make_zip(os.path.join(quarantine, '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    plan = _plan(quarantine, bids, skip=[('BL', PSC1)])
+    assert [s.status for s in plan] == [deidentify.SKIPPED]
+
+
+def test_plan_up_to_date(quarantine, bids):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    _convert(bids, zip_path)
+    assert [s.status for s in _plan(quarantine, bids)] == [
+        deidentify.UP_TO_DATE]
+
+
+def test_plan_changed(quarantine, bids):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    _convert(bids, zip_path)
+    _make_zip(zip_path, b'modified content')
+    assert [s.status for s in _plan(quarantine, bids)] == [deidentify.CHANGED]
+
+
+def test_plan_changed_converters(quarantine, bids, monkeypatch):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    _convert(bids, zip_path)
+    monkeypatch.setattr(deidentify, 'converter_versions',
+                        lambda: dict(CONVERTERS, dcm2niix='dcm2niix v2.0'))
+    assert [s.status for s in _plan(quarantine, bids)] == [deidentify.CHANGED]
+
+
+def test_plan_changed_backend(quarantine, bids):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    _convert(bids, zip_path)
+    plan = _plan(quarantine, bids, backends={'T1w': 'dicom2nifti'})
+    assert [s.status for s in plan] == [deidentify.CHANGED]
+
+
+@pytest.mark.parametrize('age, up_to_date', [(100, True), (-100, False)])
+def test_up_to_date_without_manifest(quarantine, bids, age, up_to_date):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)),
+                         age=age)
+    out_ses_path = deidentify.session_path(bids, PSC2, 'BL')
+    os.makedirs(os.path.join(out_ses_path, 'anat'))
+    open(os.path.join(out_ses_path, 'anat', 'T1w.nii.gz'), 'w').close()
+    listing = deidentify.read_zip_listing(zip_path)
+    manifest_path = os.path.join(out_ses_path, deidentify.MANIFEST_NAME)
+
+    assert deidentify.is_up_to_date(out_ses_path, zip_path,
+                                    listing) == up_to_date
+    assert not os.path.exists(manifest_path)
+
+    assert deidentify.is_up_to_date(out_ses_path, zip_path, listing,
+                                    adopt=True) == up_to_date
+    assert os.path.exists(manifest_path) == up_to_date
+    if up_to_date:
+        manifest = deidentify.read_manifest(out_ses_path)
+        assert manifest['outputs'] == ['anat/T1w.nii.gz']
+        assert deidentify.is_up_to_date(out_ses_path, zip_path, listing)
+
+
+def _staging(out_ses_path):
+    return [name for name in os.listdir(out_ses_path)
+            if name.startswith('.cveda-')]
+
+
+def test_crash_then_replan(quarantine, bids, backend):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)),
+                         age=100)
+    backend.raise_on.add('dwi')
+    with pytest.raises(RuntimeError):
+        deidentify.deidentify('BL', PSC1, zip_path, bids)
+    assert not os.path.exists(deidentify.session_path(bids, PSC2, 'BL'))
+    plan = _plan(quarantine, bids, adopt=True)
+    assert [s.status for s in plan] == [deidentify.NEW]
+
+
+def test_interrupted_then_replan(quarantine, bids, backend):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)),
+                         age=100)
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids) == 0
+    # a killed conversion leaves a staging directory and no manifest
+    out_ses_path = deidentify.session_path(bids, PSC2, 'BL')
+    os.remove(os.path.join(out_ses_path, deidentify.MANIFEST_NAME))
+    os.makedirs(os.path.join(out_ses_path, '.cveda-interrupted', 'T1w'))
+    plan = _plan(quarantine, bids, adopt=True)
+    assert [s.status for s in plan] == [deidentify.CHANGED]
+    assert deidentify.read_manifest(out_ses_path) is None
+
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids) == 0
+    assert _staging(out_ses_path) == []
+    assert [s.status for s in _plan(quarantine, bids)] == [
+        deidentify.UP_TO_DATE]
+
+
+def test_up_to_date_empty_session(quarantine, bids):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)),
+                         age=100)
+    out_ses_path = deidentify.session_path(bids, PSC2, 'BL')
+    os.makedirs(out_ses_path)
+    listing = deidentify.read_zip_listing(zip_path)
+    assert not deidentify.is_up_to_date(out_ses_path, zip_path, listing,
+                                        adopt=True)
+    assert deidentify.read_manifest(out_ses_path) is None
+
+
+T1W = 'anat/sub-{0}_ses-BL_T1w.nii.gz'.format(PSC2)
+DWI = 'dwi/sub-{0}_ses-BL_dwi.nii.gz'.format(PSC2)
+
+
+def test_deidentify(quarantine, bids, backend):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids) == 0
+    assert sorted(backend.converted) == ['T1w', 'dwi']
+    out_ses_path = deidentify.session_path(bids, PSC2, 'BL')
+    assert _staging(out_ses_path) == []
+    with open(os.path.join(out_ses_path, T1W)) as f:
+        assert f.read() == PSC2 + '/BL'
+    manifest = deidentify.read_manifest(out_ses_path)
+    assert manifest['outputs'] == [T1W, DWI]
+    assert sorted(manifest['modalities']) == ['T1w', 'dwi']
+    assert manifest['modalities']['T1w']['outputs'] == [T1W]
+    assert manifest['modalities']['dwi']['outputs'] == [DWI]
+    assert (manifest['modalities']['T1w']['converter'] ==
+            deidentify.DEFAULT_BACKEND)
+
+
+def test_deidentify_changed_modality(quarantine, bids, backend):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)),
+                         age=100)
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids) == 0
+    out_ses_path = deidentify.session_path(bids, PSC2, 'BL')
+    t1w_stat = os.stat(os.path.join(out_ses_path, T1W))
+    digests = {modality: previous['digest'] for modality, previous in
+               deidentify.read_manifest(out_ses_path)['modalities'].items()}
+    # stale file from a previous version of the converter
+    stale = os.path.join(out_ses_path, 'dwi', 'stale.nii.gz')
+    open(stale, 'w').close()
+
+    # re-upload with a different diffusion series
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '2_data_{0}bbbbbb.zip'.format(PSC1)),
+                         dwi_content=b'new diffusion series')
+    plan = _plan(quarantine, bids)
+    assert [s.status for s in plan] == [deidentify.CHANGED]
+    backend.converted = []
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids,
+                                 listing=plan[0].listing) == 0
+    assert backend.converted == ['dwi']
+    assert os.stat(os.path.join(out_ses_path, T1W)) == t1w_stat
+    assert not os.path.exists(stale)
+    assert _staging(out_ses_path) == []
+    manifest = deidentify.read_manifest(out_ses_path)
+    assert manifest['outputs'] == [T1W, DWI]
+    assert manifest['modalities']['T1w']['digest'] == digests['T1w']
+    assert manifest['modalities']['dwi']['digest'] != digests['dwi']
+    assert [s.status for s in _plan(quarantine, bids)] == [
+        deidentify.UP_TO_DATE]
+
+
+@pytest.mark.parametrize('modality_jobs', [1, 2])
+def test_deidentify_failure(quarantine, bids, backend, modality_jobs):
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '1_data_{0}aaaaaa.zip'.format(PSC1)))
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids) == 0
+    out_ses_path = deidentify.session_path(bids, PSC2, 'BL')
+
+    zip_path = _make_zip(os.path.join(quarantine,
+                                      '2_data_{0}bbbbbb.zip'.format(PSC1)),
+                         dwi_content=b'new diffusion series')
+    backend.fail_on.add('dwi')
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids,
+                                 modality_jobs=modality_jobs) != 0
+    assert not os.path.exists(out_ses_path)
+    assert not os.path.exists(os.path.dirname(out_ses_path))
+
+    backend.fail_on.clear()
+    backend.converted = []
+    assert deidentify.deidentify('BL', PSC1, zip_path, bids,
+                                 modality_jobs=modality_jobs) == 0
+    assert sorted(backend.converted) == ['T1w', 'dwi']
+    assert _staging(out_ses_path) == []
+    assert deidentify.read_manifest(out_ses_path)['outputs'] == [T1W, DWI]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import json
+import os
+from zipfile import ZipFile
+
+import pytest
+
+from cveda_databank.sanity import (VerdictCache, zip_fingerprint,
+                                   CACHE_VERSION)
+import cveda_databank.sanity.quarantine
+
+
+PARAMETERS = {'expected': None, 'integrity': False}
+RESULT = {'filename': 'data.zip', 'psc1': [], 'errors': []}
+
+
+def _make_zip(path, content=b'content'):
+    with ZipFile(path, 'w') as z:
+        z.writestr('T1w/0001.dcm', content)
+    return path
+
+
+@pytest.fixture
+def zip_path(tmpdir):
+    return _make_zip(str(tmpdir.join('data.zip')))
+
+
+@pytest.fixture
+def cache_path(tmpdir):
+    return str(tmpdir.join('cache.json'))
+
+
+def test_fingerprint(tmpdir, zip_path):
+    fingerprint = zip_fingerprint(zip_path)
+    assert fingerprint.size == os.path.getsize(zip_path)
+    assert fingerprint.digest
+    assert zip_fingerprint(zip_path) == fingerprint
+    other = _make_zip(str(tmpdir.join('other.zip')), b'other content')
+    assert zip_fingerprint(other).digest != fingerprint.digest
+
+
+def test_hit(zip_path, cache_path):
+    cache = VerdictCache(cache_path)
+    fingerprint = zip_fingerprint(zip_path)
+    assert cache.get(zip_path, fingerprint, PARAMETERS) is None
+    cache.set(zip_path, fingerprint, RESULT, PARAMETERS)
+    assert cache.get(zip_path, fingerprint, PARAMETERS) == RESULT
+    cache.save()
+    cache = VerdictCache(cache_path)
+    assert cache.get(zip_path, zip_fingerprint(zip_path), PARAMETERS) == RESULT
+
+
+def test_changed_file(zip_path, cache_path):
+    cache = VerdictCache(cache_path)
+    cache.set(zip_path, zip_fingerprint(zip_path), RESULT, PARAMETERS)
+    _make_zip(zip_path, b'modified content')
+    assert cache.get(zip_path, zip_fingerprint(zip_path), PARAMETERS) is None
+
+
+def test_changed_parameters(zip_path, cache_path):
+    cache = VerdictCache(cache_path)
+    fingerprint = zip_fingerprint(zip_path)
+    cache.set(zip_path, fingerprint, RESULT, PARAMETERS)
+    parameters = dict(PARAMETERS, integrity=True)
+    assert cache.get(zip_path, fingerprint, parameters) is None
+
+
+def test_changed_version(zip_path, cache_path):
+    cache = VerdictCache(cache_path)
+    cache.set(zip_path, zip_fingerprint(zip_path), RESULT, PARAMETERS)
+    cache.save()
+    with open(cache_path) as f:
+        verdicts = json.load(f)
+    for verdict in verdicts.values():
+        assert verdict['version'] == CACHE_VERSION
+        verdict['version'] = CACHE_VERSION - 1
+    with open(cache_path, 'w') as f:
+        json.dump(verdicts, f)
+    cache = VerdictCache(cache_path)
+    assert cache.get(zip_path, zip_fingerprint(zip_path), PARAMETERS) is None
+
+
+def test_invalid_cache(zip_path, cache_path):
+    with open(cache_path, 'w') as f:
+        f.write('not JSON')
+    cache = VerdictCache(cache_path)
+    assert cache.get(zip_path, zip_fingerprint(zip_path), PARAMETERS) is None
+
+
+def test_quarantine(tmpdir, cache_path, monkeypatch):
+    quarantine = tmpdir.mkdir('quarantine')
+    _make_zip(str(quarantine.join('1_data_000000000001aaaaaa.zip')))
+    checked = []
+    check = cveda_databank.sanity.quarantine._check_quarantine_file
+
+    def counting_check(path, *args):
+        checked.append(path)
+        return check(path, *args)
+
+    monkeypatch.setattr(cveda_databank.sanity.quarantine,
+                        '_check_quarantine_file', counting_check)
+
+    def run(**kwargs):
+        cache = VerdictCache(cache_path)
+        records = list(cveda_databank.sanity.quarantine.check_quarantine(
+            str(quarantine), cache=cache, **kwargs))
+        cache.save()
+        return records
+
+    first = run()
+    assert len(checked) == 1
+    assert run() == first
+    assert len(checked) == 1
+    run(matching='normalized')
+    assert len(checked) == 2
+    run(matching='normalized')
+    assert len(checked) == 2
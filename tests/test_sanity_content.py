@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import io
+from zipfile import ZipFile, ZIP_STORED
+try:
+    from zipfile import BadZipFile
+except ImportError:
+    from zipfile import BadZipfile as BadZipFile  # Python 2
+
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+from cveda_databank.sanity import (check_zip_content, check_zip_integrity,
+                                   check_quarantine, Sampling)
+
+PSC1 = '000000000001'
+SERIES_DESCRIPTION = 'MPRAGE'
+
+
+def _dicom_bytes(psc1=PSC1):
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.SOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+    ds.SOPInstanceUID = '1.2.3'
+    ds.SeriesInstanceUID = '1.2.4'
+    ds.SeriesNumber = 1
+    ds.SeriesDescription = SERIES_DESCRIPTION
+    ds.ImageType = ['ORIGINAL', 'PRIMARY']
+    ds.PatientID = psc1
+    ds.AcquisitionDate = '20190101'
+    f = io.BytesIO()
+    try:
+        ds.save_as(f, enforce_file_format=True)  # pydicom >= 3.0
+    except TypeError:
+        ds.is_little_endian = True
+        ds.is_implicit_VR = False
+        ds.save_as(f, write_like_original=False)
+    return f.getvalue()
+
+
+def _make_zip(path, count=3, empty=False, corrupt=False):
+    with ZipFile(path, 'w', ZIP_STORED) as z:
+        for i in range(count):
+            z.writestr('T1w/{0:04d}.dcm'.format(i), _dicom_bytes())
+        if empty:
+            z.writestr('T1w/empty.dcm', b'')
+    if corrupt:
+        # alter stored data without updating the CRC-32
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+        i = data.index(SERIES_DESCRIPTION.encode('ascii'))
+        data[i] = ord('X')
+        with open(path, 'wb') as f:
+            f.write(bytes(data))
+    return path
+
+
+def _messages(errors):
+    return [error.message for error in errors]
+
+
+def test_good(tmpdir):
+    path = _make_zip(str(tmpdir.join('good.zip')))
+    for mode in Sampling.MODES:
+        psc1, errors = check_zip_content(path, 'BL', PSC1,
+                                         expected={'T1w': 'Good'},
+                                         sampling=Sampling(mode))
+        assert list(psc1) == [PSC1]
+        assert errors == []
+
+
+def test_empty_file(tmpdir):
+    path = _make_zip(str(tmpdir.join('empty_file.zip')), empty=True)
+    for mode in Sampling.MODES:
+        psc1, errors = check_zip_content(path, 'BL', PSC1,
+                                         expected={'T1w': 'Good'},
+                                         sampling=Sampling(mode))
+        assert list(psc1) == [PSC1]
+        assert [error.path for error in errors] == ['T1w/empty.dcm']
+
+
+def test_only_empty_files(tmpdir):
+    path = _make_zip(str(tmpdir.join('only_empty.zip')), count=0, empty=True)
+    psc1, errors = check_zip_content(path, 'BL', PSC1,
+                                     expected={'T1w': 'Good'})
+    assert list(psc1) == []
+    assert [error.path for error in errors] == ['T1w/empty.dcm']
+
+
+def test_empty_zip(tmpdir):
+    path = _make_zip(str(tmpdir.join('empty.zip')), count=0)
+    psc1, errors = check_zip_content(path, 'BL', PSC1,
+                                     expected={'T1w': 'Good'})
+    assert list(psc1) == []
+    assert errors
+
+
+def test_corrupt(tmpdir):
+    path = _make_zip(str(tmpdir.join('corrupt.zip')), corrupt=True)
+    with pytest.raises(BadZipFile):
+        check_zip_content(path, 'BL', PSC1, expected={'T1w': 'Good'},
+                          sampling=Sampling('all'))
+    errors = check_zip_integrity(path)
+    assert [error.path for error in errors] == ['T1w/0000.dcm']
+    assert check_zip_integrity(_make_zip(str(tmpdir.join('good.zip')))) == []
+
+
+def test_unknown_parameters(tmpdir):
+    path = _make_zip(str(tmpdir.join('good.zip')))
+    with pytest.raises(ValueError):
+        check_zip_content(path, 'BL', PSC1, matching='approximate')
+    with pytest.raises(ValueError):
+        check_zip_content(path, 'BL', PSC1, center='unknown')
+    with pytest.raises(ValueError):
+        Sampling('random', count=0)
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+@pytest.mark.parametrize('integrity', [False, True])
+def test_quarantine(tmpdir, workers, integrity):
+    _make_zip(str(tmpdir.join('1_data_{0}aaaaaa.zip'.format(PSC1))),
+              corrupt=True)
+    _make_zip(str(tmpdir.join('2_data_{0}bbbbbb.zip'.format(PSC1))))
+    records = list(check_quarantine(str(tmpdir), {'T1w': 'Good'},
+                                    workers=workers, integrity=integrity,
+                                    sampling=Sampling('all')))
+    assert [record['filename'] for record in records] == [
+        '1_data_{0}aaaaaa.zip'.format(PSC1),
+        '2_data_{0}bbbbbb.zip'.format(PSC1),
+    ]
+    corrupt, good = records
+    assert corrupt['psc1'] == []
+    assert len(corrupt['errors']) == 1
+    assert good['psc1'] == [PSC1]
+    assert good['errors'] == []
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014-2019 CEA
+#
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software. You can use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty and the software's author, the holder of the
+# economic rights, and the successive licensors have only limited
+# liability.
+#
+# In this respect, the user's attention is drawn to the risks associated
+# with loading, using, modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean that it is complicated to manipulate, and that also
+# therefore means that it is reserved for developers and experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and, more generally, to use and operate it in the
+# same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+from zipfile import ZipFile
+try:
+    from zipfile import BadZipFile
+except ImportError:
+    from zipfile import BadZipfile as BadZipFile  # Python 2
+
+import pytest
+
+from cveda_databank.sanity import ZipTree, CompactZipTree
+
+
+_NAMES = [
+    'T1w/',
+    'T1w/0001.dcm',
+    'T1w/0002.dcm',
+    'T1w-old/0001.dcm',
+    'T1w_b/0001.dcm',
+    'T1w0/0001.dcm',
+    'dwi/ap/0001.dcm',
+    'dwi/ap/0002.dcm',
+    'dwi/rev/0001.dcm',
+    'dwi/empty.dcm',
+    'empty/',
+    'README.txt',
+]
+
+
+@pytest.fixture
+def zip_path(tmpdir):
+    path = str(tmpdir.join('data.zip'))
+    with ZipFile(path, 'w') as z:
+        for name in _NAMES:
+            if name.endswith(('/', 'empty.dcm')):
+                z.writestr(name, b'')
+            else:
+                z.writestr(name, name.encode('ascii'))
+    return path
+
+
+def _structure(ziptree):
+    return {
+        'filename': ziptree.filename,
+        'files': {f: zipinfo.filename
+                  for f, zipinfo in ziptree.files.items()},
+        'directories': {d: _structure(subtree)
+                        for d, subtree in ziptree.directories.items()},
+    }
+
+
+def _names(zipinfos):
+    return sorted(zipinfo.filename for zipinfo in zipinfos)
+
+
+def test_same_structure(zip_path):
+    assert (_structure(ZipTree.create(zip_path)) ==
+            _structure(CompactZipTree.create(zip_path)))
+
+
+def test_same_files(zip_path):
+    ziptree = ZipTree.create(zip_path)
+    compact = CompactZipTree.create(zip_path)
+    for path in ([], ['T1w'], ['dwi'], ['dwi', 'ap'], ['empty']):
+        node, compact_node = ziptree, compact
+        for d in path:
+            node = node.directories[d]
+            compact_node = compact_node.directories[d]
+        assert (_names(node.walk_zipinfo()) ==
+                _names(compact_node.walk_zipinfo()))
+        assert sorted(node.walk_files()) == sorted(compact_node.walk_files())
+        assert (_names(node.empty_files()) ==
+                _names(compact_node.empty_files()))
+        summary = node.summary()
+        compact_summary = compact_node.summary()
+        assert summary.count == compact_summary.count
+        assert _names(summary.empty) == _names(compact_summary.empty)
+        assert summary.compress_size == compact_summary.compress_size
+        assert summary.file_size == compact_summary.file_size
+
+
+def test_prefix_directories(zip_path):
+    compact = CompactZipTree.create(zip_path)
+    assert list(compact.directories['T1w'].walk_files()) == [
+        'T1w/0001.dcm',
+        'T1w/0002.dcm',
+    ]
+    assert list(compact.directories['T1w-old'].walk_files()) == [
+        'T1w-old/0001.dcm',
+    ]
+
+
+@pytest.mark.parametrize('cls', [ZipTree, CompactZipTree])
+def test_duplicate_files(tmpdir, cls):
+    path = str(tmpdir.join('duplicate.zip'))
+    with ZipFile(path, 'w') as z:
+        with pytest.warns(UserWarning):
+            z.writestr('T1w/0001.dcm', b'first')
+            z.writestr('T1w/0001.dcm', b'second')
+    with pytest.raises(BadZipFile):
+        cls.create(path)